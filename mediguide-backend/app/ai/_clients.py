@@ -0,0 +1,81 @@
+"""
+Shared LLM clients
+Built once per process so the HTTP connection pool survives across requests
+"""
+import threading
+from typing import Dict, Optional
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+from app.core.config import settings
+
+# Bound concurrency against OpenAI rate limits and keep idle connections warm
+OPENAI_HTTP_LIMITS = httpx.Limits(
+    max_connections=100,
+    max_keepalive_connections=50,
+    keepalive_expiry=60,
+)
+
+# Serializes first construction so concurrent requests never build two pools.
+# Re-entrant because GeminiService itself fetches the shared OpenAI client.
+_lock = threading.RLock()
+
+# The SDK retries connection errors, 429s and 5xx with exponential backoff itself
+OPENAI_MAX_RETRIES = settings.LLM_MAX_ATTEMPTS - 1
+
+# One client per API key, kept so they can be closed on shutdown
+_openai_clients: Dict[str, OpenAI] = {}
+_async_openai_clients: Dict[str, AsyncOpenAI] = {}
+_gemini_service = None
+
+
+def get_openai_client(api_key: Optional[str] = None) -> OpenAI:
+    """Get the process-wide OpenAI client for an API key"""
+    api_key = api_key or settings.OPENAI_API_KEY
+    with _lock:
+        client = _openai_clients.get(api_key)
+        if client is None:
+            client = _openai_clients[api_key] = OpenAI(
+                api_key=api_key,
+                max_retries=OPENAI_MAX_RETRIES,
+                http_client=httpx.Client(limits=OPENAI_HTTP_LIMITS),
+            )
+        return client
+
+
+def get_async_openai_client(api_key: Optional[str] = None) -> AsyncOpenAI:
+    """Get the process-wide AsyncOpenAI client for an API key"""
+    api_key = api_key or settings.OPENAI_API_KEY
+    with _lock:
+        client = _async_openai_clients.get(api_key)
+        if client is None:
+            client = _async_openai_clients[api_key] = AsyncOpenAI(
+                api_key=api_key,
+                max_retries=OPENAI_MAX_RETRIES,
+                http_client=httpx.AsyncClient(limits=OPENAI_HTTP_LIMITS),
+            )
+        return client
+
+
+def get_gemini_service():
+    """Get the process-wide GeminiService"""
+    global _gemini_service
+    with _lock:
+        if _gemini_service is None:
+            from app.services.gemini_service import GeminiService
+            _gemini_service = GeminiService()
+        return _gemini_service
+
+
+async def close_clients() -> None:
+    """Close pooled LLM connections; called on application shutdown"""
+    with _lock:
+        sync_clients = list(_openai_clients.values())
+        async_clients = list(_async_openai_clients.values())
+        _openai_clients.clear()
+        _async_openai_clients.clear()
+    for client in sync_clients:
+        client.close()
+    for client in async_clients:
+        await client.close()
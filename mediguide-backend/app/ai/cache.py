@@ -0,0 +1,82 @@
+"""
+Response caches for LLM calls
+Identical inputs to a deterministic prompt return the stored result instead of a new call
+"""
+import hashlib
+import re
+from typing import Any, Dict, Optional
+
+import orjson
+
+from app.core.config import settings
+from app.utils.cache import TTLCache
+
+
+def value_bucket(value: Any) -> str:
+    """Coarsen a lab value so near-identical results share a cache entry"""
+    text = str(value if value is not None else "").strip()
+    numeric_part = ''.join(c for c in text if c.isdigit() or c == '.')
+    try:
+        # Two significant digits: 13.2 and 13.4 -> "13", 142 and 144 -> "140"
+        return f"{float(numeric_part):.2g}"
+    except ValueError:
+        return text.lower()
+
+
+def make_cache_key(payload: Any) -> str:
+    """Stable SHA-256 key for a JSON-serializable payload"""
+    encoded = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS, default=str)
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def explanation_key(model: str, parameter: Dict) -> str:
+    """Cache key for a single parameter's explanation"""
+    return make_cache_key((
+        model,
+        str(parameter.get("name", "")).strip().lower(),
+        str(parameter.get("flag", "normal")).lower(),
+        value_bucket(parameter.get("value")),
+    ))
+
+
+explanation_cache = TTLCache(
+    maxsize=settings.LLM_CACHE_MAX_ENTRIES,
+    ttl=settings.LLM_CACHE_TTL_SECONDS,
+)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """Case- and whitespace-insensitive form of a chat question"""
+    return _WHITESPACE_RE.sub(" ", question.strip().lower())
+
+
+def chatbot_response_key(report_id: str, report_version: Optional[str], question: str) -> str:
+    """Cache key for a chatbot answer about one version of a report"""
+    return make_cache_key((report_id, report_version, normalize_question(question)))
+
+
+# In-process tier in front of the synthesis_cache table
+synthesis_cache = TTLCache(
+    maxsize=512,
+    ttl=settings.SYNTHESIS_CACHE_TTL_DAYS * 86_400,
+)
+
+# Rendered, anonymized chatbot context per report; reused across the turns of a chat
+chatbot_context_cache = TTLCache(
+    maxsize=1000,
+    ttl=settings.CHAT_CONTEXT_CACHE_TTL_SECONDS,
+)
+
+# Reports pinned to the OpenAI fallback after a Gemini failure; entries lapse so Gemini is retried later
+chatbot_sticky_models = TTLCache(
+    maxsize=10_000,
+    ttl=settings.CHAT_STICKY_MODEL_TTL_SECONDS,
+)
+
+# Chatbot answers per (report, normalized question)
+chatbot_response_cache = TTLCache(
+    maxsize=10_000,
+    ttl=settings.CHAT_RESPONSE_CACHE_TTL_SECONDS,
+)
@@ -4,12 +4,15 @@ Strict safety constraints: NO diagnosis, NO prescriptions
 """
 import json
 from typing import List, Dict, Optional
-from openai import OpenAI
 from app.core.config import settings
+from app.ai._clients import get_async_openai_client
 from app.ai.prompts import (
     get_chatbot_system_prompt,
+    get_chatbot_context_prompt,
     check_for_diagnosis_request,
-    CHATBOT_REFUSAL_RESPONSES
+    trim_chat_history,
+    CHATBOT_REFUSAL_RESPONSES,
+    CHATBOT_FORBIDDEN_PHRASES_RE
 )
 import random
 
@@ -21,7 +24,7 @@ class ChatbotService:
         if not settings.OPENAI_API_KEY:
             raise ValueError("OPENAI_API_KEY not configured")
         
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        self.client = get_async_openai_client(settings.OPENAI_API_KEY)
         self.model = settings.OPENAI_MODEL
     
     async def generate_response(
@@ -50,29 +53,29 @@ class ChatbotService:
             return random.choice(CHATBOT_REFUSAL_RESPONSES)
         
         # Build conversation context
-        system_prompt = get_chatbot_system_prompt(report_type, parameters_summary)
-        
+        # Static system prompt first so it is cacheable; report context follows
         messages = [
-            {"role": "system", "content": system_prompt}
+            {"role": "system", "content": get_chatbot_system_prompt()},
+            {"role": "user", "content": get_chatbot_context_prompt(report_type, parameters_summary)}
         ]
         
-        # Add chat history if available
-        if chat_history:
-            for msg in chat_history[-5:]:  # Last 5 messages for context
-                messages.append({
-                    "role": "user" if msg.get("role") == "user" else "assistant",
-                    "content": msg.get("content", "")
-                })
+        # Add recent chat history, bounded by token budget rather than message count
+        for msg in trim_chat_history(chat_history, settings.CHAT_HISTORY_TOKEN_BUDGET):
+            messages.append({
+                "role": "user" if msg.get("role") == "user" else "assistant",
+                "content": msg.get("content", "")
+            })
         
         # Add current message
         messages.append({"role": "user", "content": message})
         
         try:
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 temperature=0.7,
                 max_tokens=300,
+                timeout=settings.LLM_CHAT_TIMEOUT_SECONDS,
                 # Add safety constraints
                 stop=["diagnosis", "prescribe", "treatment for you"]  # Stop if these words appear
             )
@@ -98,21 +101,9 @@ class ChatbotService:
         Returns:
             Sanitized response
         """
-        response_lower = response.lower()
-        
         # Check for forbidden phrases
-        forbidden_phrases = [
-            "you have",
-            "you are diagnosed",
-            "you should take",
-            "prescribe",
-            "treatment is",
-            "you need medication"
-        ]
-        
-        for phrase in forbidden_phrases:
-            if phrase in response_lower:
-                # Replace with safe alternative
-                return random.choice(CHATBOT_REFUSAL_RESPONSES)
+        if CHATBOT_FORBIDDEN_PHRASES_RE.search(response):
+            # Replace with safe alternative
+            return random.choice(CHATBOT_REFUSAL_RESPONSES)
         
         return response
@@ -1,19 +1,63 @@
 """
 AI service for generating medical test explanations
-Uses OpenAI with strict safety constraints
+Uses Gemini or OpenAI with strict safety constraints
 """
-import json
-from typing import Dict, List
+import asyncio
+import copy
+import logging
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional
+import orjson
 from app.core.config import settings
-from app.ai.prompts import get_batch_explanation_prompt
+from app.ai.prompts import get_batch_explanation_prompt, FORBIDDEN_PHRASES_RE
+from app.ai._clients import get_async_openai_client, get_gemini_service
+from app.ai.cache import explanation_cache, explanation_key
+from app.services.gemini_service import GEMINI_TRANSIENT_ERRORS
+from app.utils.retry import retry_async
+
+logger = logging.getLogger(__name__)
+
+# Cap concurrent outgoing LLM calls per process to stay under provider rate limits
+MAX_CONCURRENT_LLM_CALLS = 10
+_llm_semaphore = asyncio.Semaphore(MAX_CONCURRENT_LLM_CALLS)
+
+
+@lru_cache(maxsize=8192)
+def _sanitize_text(text: str) -> str:
+    """Remove any diagnosis/treatment language"""
+    # Pure function: boilerplate like "This test measures..." recurs verbatim across reports
+    return FORBIDDEN_PHRASES_RE.sub("may indicate", text)
+
+
+def latest_explanations(explanations: Iterable[Dict]) -> Dict[Any, Dict]:
+    """
+    Newest explanation per parameter_id, by generated_at.
+    Every reader (report views and chat context) picks explanations with this one rule.
+    """
+    latest = {}
+    for e in explanations:
+        pid = e.get("parameter_id")
+        if pid is None:
+            continue
+        current = latest.get(pid)
+        if current is None or (e.get("generated_at") or "") >= (current.get("generated_at") or ""):
+            latest[pid] = e
+    return latest
 
 
 class ExplanationService:
     """Service for generating AI explanations of medical test results"""
     
-    def __init__(self):
-        from app.services.gemini_service import GeminiService
-        self.gemini = GeminiService()
+    def __init__(self, provider: Optional[str] = None):
+        self.provider = provider or settings.AI_PROVIDER
+        if self.provider == "openai":
+            self.openai_client = get_async_openai_client(settings.OPENAI_API_KEY)
+            self.model_name = settings.OPENAI_MODEL
+        elif self.provider == "gemini":
+            self.gemini = get_gemini_service()
+            self.model_name = self.gemini.model_name
+        else:
+            raise ValueError(f"Unknown AI provider: {self.provider}")
     
     async def generate_report_explanations(
         self,
@@ -22,20 +66,48 @@ class ExplanationService:
     ) -> List[Dict]:
         """
         Generate AI explanations for ALL parameters in one batch call.
-        Strictly one request per report.
+        Strictly one request per report; parameters already explained
+        (same name, flag and similar value) are served from cache and left out of the prompt.
         """
         if not parameters:
             return []
 
+        keys = [explanation_key(self.model_name, p) for p in parameters]
+        results: List[Optional[Dict]] = [explanation_cache.get(k) for k in keys]
+        misses = [p for p, hit in zip(parameters, results) if hit is None]
+
+        extra = []
+        if misses:
+            generated = await self._generate_batch(misses)
+
+            # The prompt echoes "name" back, so map results onto the missed inputs
+            by_name = {}
+            for exp in generated:
+                name = str(exp.get("name", "")).strip().lower()
+                if name and name not in by_name:
+                    by_name[name] = exp
+                else:
+                    extra.append(exp)
+
+            for i, (param, hit) in enumerate(zip(parameters, results)):
+                if hit is not None:
+                    continue
+                exp = by_name.pop(str(param.get("name", "")).strip().lower(), None)
+                if exp is not None:
+                    results[i] = exp
+                    explanation_cache.set(keys[i], exp)
+            extra.extend(by_name.values())
+
+        return [copy.deepcopy(r) for r in results if r is not None] + extra
+
+    async def _generate_batch(self, parameters: List[Dict]) -> List[Dict]:
+        """Single LLM call explaining the given parameters"""
         prompt_data = get_batch_explanation_prompt(parameters)
 
         prompt = f"""
         You are a medical explanations assistant.
         Analyze the following medical test results and provide simple, educational explanations for each.
         
-        INPUT DATA:
-        {prompt_data}
-        
         RETURN ONLY A JSON ARRAY of objects, where each object has:
         - "name": Test name
         - "what": What this test measures
@@ -45,11 +117,14 @@ class ExplanationService:
         - "flag": The original flag (normal/high/low)
         
         Ensure the output is a valid JSON list.
+        
+        INPUT DATA:
+        {prompt_data}
         """
 
         try:
-            # Call Gemini
-            data = self.gemini.generate_json(prompt)
+            async with _llm_semaphore:
+                data = await self._call_llm(prompt)
             
             explanations = []
             if isinstance(data, list):
@@ -67,8 +142,6 @@ class ExplanationService:
                 # Basic validation
                 if not isinstance(exp, dict): continue
                 
-                # Match by name if possible? 
-                # For now just sanitize what we got
                 flag = exp.get("flag", "normal")
                 sanitized = self._validate_explanation(exp, flag)
                 
@@ -77,13 +150,38 @@ class ExplanationService:
                     sanitized["name"] = exp["name"]
                     
                 valid_explanations.append(sanitized)
-                
+
             return valid_explanations
 
         except Exception as e:
-            print(f"[ERROR] Batch AI explanation failed: {e}")
+            logger.error("Batch AI explanation failed: %s", e)
             return [] # Graceful degradation
 
+    async def _call_llm(self, prompt: str) -> Any:
+        """Send the prompt to the configured provider and return parsed JSON"""
+        if self.provider == "openai":
+            # JSON mode returns an object; the list is picked out of its values by the caller
+            response = await self.openai_client.chat.completions.create(
+                model=self.model_name,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.2,
+                response_format={"type": "json_object"},
+                timeout=settings.LLM_EXPLANATION_TIMEOUT_SECONDS
+            )
+            return orjson.loads(response.choices[0].message.content)
+
+        # Call Gemini off the event loop; the SDK call is blocking.
+        # The deadline is the SDK's request timeout (raised as DeadlineExceeded), so a timed-out
+        # attempt really ends before the retry instead of running on in its thread
+        return await retry_async(
+            asyncio.to_thread,
+            self.gemini.generate_json,
+            prompt,
+            attempts=settings.LLM_MAX_ATTEMPTS,
+            retry_on=GEMINI_TRANSIENT_ERRORS,
+            timeout=settings.LLM_EXPLANATION_TIMEOUT_SECONDS
+        )
+
     async def generate_explanation(
         self,
         parameter_name: str,
@@ -115,34 +213,15 @@ class ExplanationService:
             result["next_steps"] = []
         
         # Add "consult your doctor" if abnormal
-        if flag != 'normal' and "consult" not in ' '.join(result["next_steps"]).lower():
+        if flag != 'normal' and not any("consult" in str(s or "").lower() for s in result["next_steps"]):
             result["next_steps"].append("Consult your doctor for personalized medical advice.")
         
         # Remove any diagnosis/treatment language (basic check)
-        result["meaning"] = self._sanitize_text(result["meaning"])
-        result["what"] = self._sanitize_text(result["what"])
+        result["meaning"] = _sanitize_text(result["meaning"])
+        result["what"] = _sanitize_text(result["what"])
         
         return result
     
-    def _sanitize_text(self, text: str) -> str:
-        """Remove any diagnosis/treatment language"""
-        # Basic sanitization - can be enhanced
-        forbidden_phrases = [
-            "you have",
-            "you are diagnosed",
-            "you should take",
-            "prescribe",
-            "treatment is"
-        ]
-        
-        text_lower = text.lower()
-        for phrase in forbidden_phrases:
-            if phrase in text_lower:
-                # Replace with safe alternative
-                text = text.replace(phrase, "may indicate")
-        
-        return text
-    
     def _parse_fallback_explanation(self, content: str) -> Dict:
         """Parse explanation from non-JSON response"""
         return {
@@ -2,7 +2,11 @@
 Safety-focused prompts for AI explanations and chatbot
 CRITICAL: These prompts enforce NO diagnosis, NO prescriptions
 """
-from typing import List
+import re
+import string
+from typing import Callable, Dict, List, Optional
+
+import orjson
 
 
 EXPLANATION_PROMPT_TEMPLATE = """You are a medical information assistant. Your role is to explain medical test results in an educational, non-diagnostic manner.
@@ -17,11 +21,6 @@ CRITICAL RULES:
 - NEVER prescribe medications
 - NEVER make claims about the patient's specific condition
 
-Test Parameter: {parameter_name}
-Value: {value}
-Normal Range: {normal_range}
-Flag: {flag}
-
 Provide a structured explanation with:
 1. "what" - What this test measures (educational)
 2. "meaning" - What the result means in general terms
@@ -35,6 +34,11 @@ Format your response as JSON:
     "causes": ["...", "..."],
     "next_steps": ["...", "..."]
 }}
+
+Test Parameter: {parameter_name}
+Value: {value}
+Normal Range: {normal_range}
+Flag: {flag}
 """
 
 
@@ -56,13 +60,43 @@ STRICT PROHIBITIONS:
 If asked about diagnosis or treatment, you MUST respond:
 "I cannot provide medical diagnoses or treatment recommendations. Please consult with a qualified healthcare provider for personalized medical advice."
 
-Current Report Context:
-- Report Type: {report_type}
-- Test Parameters: {parameters_summary}
+The current report context is provided in the next message.
 
 Remember: You are an educational tool, not a replacement for medical consultation."""
 
 
+# Per-report context is sent as a separate message after the static system prompt,
+# so the system prompt stays byte-identical across calls and hits OpenAI's prefix cache
+CHATBOT_CONTEXT_TEMPLATE = """Current Report Context:
+- Report Type: {report_type}
+- Test Parameters: {parameters_summary}"""
+
+
+def _compile_template(template: str) -> Callable[..., str]:
+    """
+    Split a str.format template once into literal chunks and field names,
+    so rendering is a join over the slots rather than a re-parse of the template
+    """
+    chunks = []
+    for literal, field, spec, conversion in string.Formatter().parse(template):
+        if spec or conversion:
+            raise ValueError(f"Unsupported format spec in prompt template field {field!r}")
+        if literal:
+            chunks.append((literal, None))
+        if field is not None:
+            chunks.append(("", field))
+    chunks = tuple(chunks)
+
+    def render(**values) -> str:
+        return "".join([literal if field is None else str(values[field]) for literal, field in chunks])
+
+    return render
+
+
+_render_explanation_prompt = _compile_template(EXPLANATION_PROMPT_TEMPLATE)
+_render_chatbot_context = _compile_template(CHATBOT_CONTEXT_TEMPLATE)
+
+
 CHATBOT_REFUSAL_RESPONSES = [
     "I cannot provide medical diagnoses or treatment recommendations. Please consult with a qualified healthcare provider for personalized medical advice.",
     "I'm designed to provide educational information only. For medical diagnosis and treatment, please consult a healthcare professional.",
@@ -72,7 +106,7 @@ CHATBOT_REFUSAL_RESPONSES = [
 
 def get_explanation_prompt(parameter_name: str, value: str, normal_range: str, flag: str) -> str:
     """Generate prompt for AI explanation"""
-    return EXPLANATION_PROMPT_TEMPLATE.format(
+    return _render_explanation_prompt(
         parameter_name=parameter_name,
         value=value,
         normal_range=normal_range,
@@ -80,14 +114,77 @@ def get_explanation_prompt(parameter_name: str, value: str, normal_range: str, f
     )
 
 
-def get_chatbot_system_prompt(report_type: str, parameters_summary: str) -> str:
-    """Generate system prompt for chatbot"""
-    return CHATBOT_SYSTEM_PROMPT.format(
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English text)"""
+    return len(text) // 4 + 1
+
+
+def trim_chat_history(chat_history: Optional[List[Dict]], token_budget: int) -> List[Dict]:
+    """Most recent messages that fit in the token budget, oldest first"""
+    if not chat_history:
+        return []
+    kept = []
+    used = 0
+    for msg in reversed(chat_history):
+        used += estimate_tokens(msg.get("content") or "")
+        if used > token_budget:
+            break
+        kept.append(msg)
+    kept.reverse()
+    return kept
+
+
+def get_chatbot_system_prompt() -> str:
+    """Static system prompt for chatbot"""
+    return CHATBOT_SYSTEM_PROMPT
+
+
+def get_chatbot_context_prompt(report_type: str, parameters_summary: str) -> str:
+    """Generate the per-report context message for chatbot"""
+    return _render_chatbot_context(
         report_type=report_type,
         parameters_summary=parameters_summary
     )
 
 
+# Keyword and phrase tables; matched case-insensitively
+DIAGNOSIS_KEYWORDS = (
+    "diagnose", "diagnosis", "what do i have", "what's wrong with me",
+    "do i have", "am i sick", "what disease", "what condition"
+)
+
+TREATMENT_KEYWORDS = (
+    "prescribe", "prescription", "what medicine", "what treatment",
+    "how to treat", "cure", "medication", "drug"
+)
+
+# Phrases stripped from AI explanations
+FORBIDDEN_PHRASES = (
+    "you have",
+    "you are diagnosed",
+    "you should take",
+    "prescribe",
+    "treatment is",
+)
+
+# Chatbot replies are held to a stricter list
+CHATBOT_FORBIDDEN_PHRASES = FORBIDDEN_PHRASES + ("you need medication",)
+
+# Questions MediBot refuses outright, before any model call
+CHATBOT_UNSAFE_KEYWORDS = ("prescribe", "medication for me", "diagnose me", "do i have cancer", "am i dying")
+
+
+def _compile_phrases(phrases) -> re.Pattern:
+    """Compile phrases into one case-insensitive alternation: a single C-level pass per text"""
+    return re.compile("|".join(re.escape(p) for p in phrases), re.IGNORECASE)
+
+
+DIAGNOSIS_REQUEST_RE = _compile_phrases(DIAGNOSIS_KEYWORDS + TREATMENT_KEYWORDS)
+FORBIDDEN_PHRASES_RE = _compile_phrases(FORBIDDEN_PHRASES)
+CHATBOT_FORBIDDEN_PHRASES_RE = _compile_phrases(CHATBOT_FORBIDDEN_PHRASES)
+CHATBOT_UNSAFE_QUESTION_RE = _compile_phrases(CHATBOT_UNSAFE_KEYWORDS)
+
+
 def check_for_diagnosis_request(message: str) -> bool:
     """
     Check if user message is requesting diagnosis or treatment
@@ -95,19 +192,7 @@ def check_for_diagnosis_request(message: str) -> bool:
     Returns:
         True if message appears to request diagnosis/treatment
     """
-    message_lower = message.lower()
-    
-    diagnosis_keywords = [
-        "diagnose", "diagnosis", "what do i have", "what's wrong with me",
-        "do i have", "am i sick", "what disease", "what condition"
-    ]
-    
-    treatment_keywords = [
-        "prescribe", "prescription", "what medicine", "what treatment",
-        "how to treat", "cure", "medication", "drug"
-    ]
-    
-    return any(keyword in message_lower for keyword in diagnosis_keywords + treatment_keywords)
+    return DIAGNOSIS_REQUEST_RE.search(message) is not None
 
 
 BATCH_EXPLANATION_PROMPT_TEMPLATE = """You are a medical report explanation assistant.
@@ -128,8 +213,9 @@ Lab results:
 Return ONLY valid JSON. No markdown. No explanation text.
 """
 
+_render_batch_explanation_prompt = _compile_template(BATCH_EXPLANATION_PROMPT_TEMPLATE)
+
 def get_batch_explanation_prompt(parameters: List[dict]) -> str:
-    import json
-    # Minify JSON to save tokens
-    params_json = json.dumps(parameters, separators=(',', ':'))
-    return BATCH_EXPLANATION_PROMPT_TEMPLATE.format(parameters_json=params_json)
+    # orjson output is already minified, which saves tokens
+    params_json = orjson.dumps(parameters, default=str).decode()
+    return _render_batch_explanation_prompt(parameters_json=params_json)
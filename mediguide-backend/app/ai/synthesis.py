@@ -1,17 +1,127 @@
 """
 AI Service for synthesizing medical reports and identifying trends
 """
-import json
-from typing import Dict, List, Optional
-from typing import Dict, List, Optional
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional
+import orjson
 from app.core.config import settings
+from app.ai.cache import make_cache_key, synthesis_cache
+from app.ai._clients import get_async_openai_client, get_gemini_service
+from app.utils.json_stream import JsonObjectFieldStream
+
+logger = logging.getLogger(__name__)
+
+# Most recent readings per parameter sent to the LLM; older ones are summarized
+HISTORY_READINGS_PER_PARAMETER = 6
+
+# Static instruction prefix; report data is sent separately as the user content
+SYNTHESIS_SYSTEM_PROMPT = """You are an expert medical AI assistant helping a doctor review patient history.
+Your goal is to synthesize the CURRENT report findings in the context of PAST reports.
+Identify what has changed, improved, or worsened.
+
+The user message is a minified JSON object:
+- "current": the current report (d=date, t=type, p=parameters with n=name, v=value, u=unit, f=flag)
+- "trends": pre-computed per-parameter series (n=name, u=unit, s=chronological [date, value] pairs), when available
+- "history": past reports in the same format as "current", sent when no trends were pre-computed
+- "older": summarized older readings (n=name, k=count, o=oldest [date, value]), when available
+- "codes": legend of short parameter codes used in place of repeated names (code -> full name), when available.
+  Always write the full parameter names in your output, never the codes.
+
+TASK:
+1. Summarize the user's current health status based on this report.
+2. Describe key trends in prose from "trends" or "history" (e.g., "Hemoglobin has increased from 11.2 to 12.5").
+3. Write a "Doctor's Précis" - a concise, professional summary for a GP.
+4. Provide 3-4 "Suggested Questions for Your Doctor" relevant to these specific results.
+5. Provide 3-4 "Wellness Recommendations" (Nutrition, Hydration, Lifestyle) relevant to these results.
+
+RETURN STRICT JSON FORMAT:
+{
+    "status_summary": "1-2 sentences on current status",
+    "key_trends": ["trend 1", "trend 2"],
+    "doctor_precis": "Paragraph for the doctor",
+    "suggested_questions": ["question 1", "question 2"],
+    "wellness_tips": [
+        {"title": "Nutrition", "content": "specific tip..."},
+        {"title": "Hydration", "content": "specific tip..."},
+        {"title": "Follow-up", "content": "specific tip..."}
+    ]
+}"""
+
+# Top-level fields of a complete synthesis (see SYNTHESIS_SYSTEM_PROMPT)
+SYNTHESIS_FIELDS = ("status_summary", "key_trends", "doctor_precis", "suggested_questions", "wellness_tips")
+
+# Returned when the model could not produce a synthesis
+SYNTHESIS_UNAVAILABLE = {
+    "status_summary": "Could not generate synthesis.",
+    "key_trends": [],
+    "doctor_precis": "AI Synthesis unavailable.",
+    "wellness_tips": [
+        {"title": "Nutrition", "content": "Maintain a balanced diet."},
+        {"title": "Hydration", "content": "Stay well hydrated."},
+        {"title": "Follow-up", "content": "Consult your doctor for next steps."}
+    ]
+}
 
 class SynthesisService:
     """Service for generating comprehensive medical syntheses"""
 
-    def __init__(self):
-        from app.services.gemini_service import GeminiService
-        self.gemini = GeminiService()
+    def __init__(self, db=None, provider: Optional[str] = None):
+        self.provider = provider or settings.AI_PROVIDER
+        if self.provider == "openai":
+            self.openai_client = get_async_openai_client(settings.OPENAI_API_KEY)
+            self.model_name = settings.OPENAI_MODEL
+        elif self.provider == "gemini":
+            self.gemini = get_gemini_service()
+            self.model_name = self.gemini.model_name
+        else:
+            raise ValueError(f"Unknown AI provider: {self.provider}")
+        # Service-role Supabase client for the persistent synthesis_cache table (optional)
+        self.db = db
+        self.semantic_cache = bool(
+            db is not None and settings.SYNTHESIS_SEMANTIC_CACHE_ENABLED and settings.OPENAI_API_KEY
+        )
+
+    def _load_cached(self, key: str) -> Optional[Dict]:
+        """Fetch a non-expired synthesis from the synthesis_cache table"""
+        cutoff = datetime.now(timezone.utc) - timedelta(days=settings.SYNTHESIS_CACHE_TTL_DAYS)
+        response = (
+            self.db.table("synthesis_cache")
+            .select("result")
+            .eq("key", key)
+            .gte("created_at", cutoff.isoformat())
+            .limit(1)
+            .execute()
+        )
+        return response.data[0]["result"] if response.data else None
+
+    def _store_cached(self, key: str, result: Dict, embedding: Optional[List[float]] = None):
+        """Persist a synthesis to the synthesis_cache table"""
+        row = {
+            "key": key,
+            "result": result,
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }
+        if embedding is not None:
+            row["embedding"] = embedding
+        self.db.table("synthesis_cache").upsert(row).execute()
+
+    async def _embed(self, payload: str) -> List[float]:
+        """Embedding of the minified payload for near-duplicate lookup"""
+        client = get_async_openai_client(settings.OPENAI_API_KEY)
+        response = await client.embeddings.create(model=settings.EMBEDDING_MODEL, input=payload)
+        return response.data[0].embedding
+
+    def _match_cached(self, embedding: List[float]) -> Optional[Dict]:
+        """Closest cached synthesis above the similarity threshold"""
+        cutoff = datetime.now(timezone.utc) - timedelta(days=settings.SYNTHESIS_CACHE_TTL_DAYS)
+        response = self.db.rpc("match_synthesis_cache", {
+            "query_embedding": embedding,
+            "min_similarity": settings.SYNTHESIS_SEMANTIC_CACHE_MIN_SIMILARITY,
+            "min_created_at": cutoff.isoformat()
+        }).execute()
+        return response.data[0]["result"] if response.data else None
 
     def _minify_report_data(self, report: Dict) -> Dict:
         """Extract only essential data for AI processing to save tokens"""
@@ -31,6 +141,182 @@ class SynthesisService:
             "p": minified_params # p = parameters
         }
 
+    def _prune_history(self, current_data: Dict, related_reports: List[Dict]):
+        """Keep the latest readings of the current parameters; summarize the rest"""
+        current_names = {p["n"] for p in current_data["p"]}
+        minified = [self._minify_report_data(r) for r in related_reports]
+        minified.sort(key=lambda r: r["d"] or "", reverse=True)
+
+        kept_counts = {}
+        older = {}
+        history_context = []
+        for report in minified:
+            kept = []
+            for p in report["p"]:
+                if p["n"] not in current_names:
+                    continue
+                if kept_counts.get(p["n"], 0) < HISTORY_READINGS_PER_PARAMETER:
+                    kept_counts[p["n"]] = kept_counts.get(p["n"], 0) + 1
+                    kept.append(p)
+                else:
+                    older.setdefault(p["n"], []).append([report["d"], p["v"]])
+            # Reports sharing no parameter with the current one carry no signal
+            if kept:
+                report["p"] = kept
+                history_context.append(report)
+
+        # n=name, k=number of older readings, o=oldest [date, value]
+        older_summary = [
+            {"n": name, "k": len(points), "o": points[-1]}
+            for name, points in older.items()
+        ]
+        return history_context, older_summary
+
+    def _compress_names(self, payload: Dict) -> Dict:
+        """Replace parameter names repeated across the payload with short codes plus one legend"""
+        sections = [payload["current"]["p"], payload.get("trends", []), payload.get("older", [])]
+        sections += [report["p"] for report in payload.get("history", [])]
+
+        counts = {}
+        for items in sections:
+            for item in items:
+                counts[item["n"]] = counts.get(item["n"], 0) + 1
+        # Only names that repeat (and are longer than a code) are worth a legend entry
+        names = [name for name, count in counts.items() if count > 1 and name and len(name) > 3]
+        if not names:
+            return payload
+
+        codes = {name: f"P{i}" for i, name in enumerate(names, 1)}
+        compressed = {"codes": {code: name for name, code in codes.items()}}
+        for key, value in payload.items():
+            if key == "current":
+                compressed[key] = {**value, "p": [{**p, "n": codes.get(p["n"], p["n"])} for p in value["p"]]}
+            elif key == "history":
+                compressed[key] = [
+                    {**r, "p": [{**p, "n": codes.get(p["n"], p["n"])} for p in r["p"]]} for r in value
+                ]
+            else:
+                compressed[key] = [{**item, "n": codes.get(item["n"], item["n"])} for item in value]
+        return compressed
+
+    def _compute_trends(self, current_data: Dict, history_context: List[Dict]) -> List[Dict]:
+        """Chronological values per current parameter, so the LLM only has to describe them"""
+        series = {}
+        for report in history_context + [current_data]:
+            for p in report["p"]:
+                series.setdefault(p["n"], []).append([report["d"], p["v"]])
+
+        trends = []
+        for p in current_data["p"]:
+            points = series.pop(p["n"], [])
+            if len(points) > 1:
+                points.sort(key=lambda point: point[0] or "")
+                trends.append({"n": p["n"], "u": p["u"], "s": points})
+        return trends
+
+    def _prepare(self, current_report: Dict, related_reports: List[Dict]):
+        """Minified context, its cache key and the user prompt"""
+        current_data = self._minify_report_data(current_report)
+        # History only matters for parameters present in the current report
+        history_context, older_summary = self._prune_history(current_data, related_reports)
+
+        # Identical current + history payloads always produce the same synthesis input
+        cache_key = make_cache_key([current_data, history_context, older_summary])
+
+        # Only the minified data varies per call; instructions live in the static system prompt
+        payload = {"current": current_data}
+        # Pre-computed trends replace the raw history when there is more than one reading
+        trends = self._compute_trends(current_data, history_context)
+        if trends:
+            payload["trends"] = trends
+        else:
+            payload["history"] = history_context
+        if older_summary:
+            payload["older"] = older_summary
+        payload = self._compress_names(payload)
+        # orjson emits compact UTF-8 directly (no ensure_ascii escapes such as "\u00e9")
+        prompt = orjson.dumps(payload, default=str).decode()
+        return current_data, history_context, cache_key, prompt
+
+    async def _lookup_cached(self, cache_key: str, current_data: Dict, history_context: List[Dict]):
+        """Cached synthesis (or None) plus the embedding computed for the semantic lookup"""
+        cached = synthesis_cache.get(cache_key)
+        if cached is not None:
+            return cached, None
+        if self.db is not None:
+            try:
+                cached = await asyncio.to_thread(self._load_cached, cache_key)
+                if cached is not None:
+                    synthesis_cache.set(cache_key, cached)
+                    return cached, None
+            except Exception as e:
+                logger.warning("Synthesis cache lookup failed: %s", e)
+
+        # Near-duplicate lookup on exact miss
+        embedding = None
+        if self.semantic_cache:
+            try:
+                embedding = await self._embed(orjson.dumps([current_data, history_context], default=str).decode())
+                cached = await asyncio.to_thread(self._match_cached, embedding)
+                if cached is not None:
+                    synthesis_cache.set(cache_key, cached)
+                    return cached, embedding
+            except Exception as e:
+                logger.warning("Synthesis semantic cache lookup failed: %s", e)
+        return None, embedding
+
+    async def _remember(self, cache_key: str, result: Dict, embedding: Optional[List[float]]):
+        """Store a fresh synthesis in both cache tiers"""
+        synthesis_cache.set(cache_key, result)
+        if self.db is not None:
+            try:
+                await asyncio.to_thread(self._store_cached, cache_key, result, embedding)
+            except Exception as e:
+                logger.warning("Synthesis cache write failed: %s", e)
+
+    async def _call_llm(self, prompt: str) -> Dict:
+        """Send the data payload with the static system prompt and return parsed JSON"""
+        if self.provider == "openai":
+            response = await self.openai_client.chat.completions.create(
+                model=self.model_name,
+                messages=[
+                    {"role": "system", "content": SYNTHESIS_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                response_format={"type": "json_object"}
+            )
+            return orjson.loads(response.choices[0].message.content)
+
+        # The Gemini SDK call blocks; keep it off the event loop
+        return await asyncio.to_thread(
+            self.gemini.generate_json, prompt, system_instruction=SYNTHESIS_SYSTEM_PROMPT
+        )
+
+    async def _stream_llm(self, prompt: str) -> AsyncIterator[str]:
+        """Raw JSON text chunks from the configured provider"""
+        if self.provider == "openai":
+            stream = await self.openai_client.chat.completions.create(
+                model=self.model_name,
+                messages=[
+                    {"role": "system", "content": SYNTHESIS_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                response_format={"type": "json_object"},
+                stream=True
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+            return
+
+        chunks = self.gemini.generate_json_stream(prompt, system_instruction=SYNTHESIS_SYSTEM_PROMPT)
+        while True:
+            # Each blocking SDK read runs off the event loop
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+
     async def generate_synthesis(
         self, 
         current_report: Dict, 
@@ -39,57 +325,58 @@ class SynthesisService:
         """
         Generate a synthesis of the current report in context of history.
         """
-        
-        # Prepare context data (Minified)
-        history_context = [self._minify_report_data(r) for r in related_reports]
-        current_data = self._minify_report_data(current_report)
+        current_data, history_context, cache_key, prompt = self._prepare(current_report, related_reports)
+        cached, embedding = await self._lookup_cached(cache_key, current_data, history_context)
+        if cached is not None:
+            return cached
+
+        try:
+            result = await self._call_llm(prompt)
+        except Exception as e:
+            logger.error("Synthesis generation failed: %s", e)
+            return dict(SYNTHESIS_UNAVAILABLE)
+
+        await self._remember(cache_key, result, embedding)
+        return result
 
-        # Combined Prompt for Gemini
-        prompt = f"""
-        You are an expert medical AI assistant helping a doctor review patient history.
-        Your goal is to synthesize the CURRENT report findings in the context of PAST reports.
-        Identify what has changed, improved, or worsened.
-        Input data is minified: d=date, t=type, p=parameters (n=name, v=value, u=unit, f=flag).
-        
-        CURRENT REPORT:
-        {json.dumps(current_data, separators=(',', ':'))}
-
-        HISTORY:
-        {json.dumps(history_context, separators=(',', ':'))}
-
-        TASK:
-        1. Summarize the user's current health status based on this report.
-        2. Identify key trends (e.g., "Hemoglobin has increased from 11.2 to 12.5").
-        3. Write a "Doctor's Précis" - a concise, professional summary for a GP.
-        4. Provide 3-4 "Suggested Questions for Your Doctor" relevant to these specific results.
-        5. Provide 3-4 "Wellness Recommendations" (Nutrition, Hydration, Lifestyle) relevant to these results.
-
-        RETURN STRICT JSON FORMAT:
-        {{
-            "status_summary": "1-2 sentences on current status",
-            "key_trends": ["trend 1", "trend 2"],
-            "doctor_precis": "Paragraph for the doctor",
-            "suggested_questions": ["question 1", "question 2"],
-            "wellness_tips": [
-                {{"title": "Nutrition", "content": "specific tip..."}},
-                {{"title": "Hydration", "content": "specific tip..."}},
-                {{"title": "Follow-up", "content": "specific tip..."}}
-            ]
-        }}
+    async def generate_synthesis_stream(
+        self,
+        current_report: Dict,
+        related_reports: List[Dict]
+    ) -> AsyncIterator[Dict[str, Any]]:
         """
+        Stream the synthesis as {"field": ..., "value": ...} items, one per top-level field,
+        as soon as each field is complete. Cached results are replayed field by field.
+        The last item is {"complete": bool}: False when the model stopped before closing the
+        object and the missing fields were filled with placeholders.
+        """
+        current_data, history_context, cache_key, prompt = self._prepare(current_report, related_reports)
+        cached, embedding = await self._lookup_cached(cache_key, current_data, history_context)
+        if cached is not None:
+            for field, value in cached.items():
+                yield {"field": field, "value": value}
+            yield {"complete": True}
+            return
 
+        parser = JsonObjectFieldStream()
+        result = {}
         try:
-            return self.gemini.generate_json(prompt)
-
+            async for chunk in self._stream_llm(prompt):
+                for field, value in parser.feed(chunk):
+                    result[field] = value
+                    yield {"field": field, "value": value}
+                if parser.done:
+                    break
         except Exception as e:
-            print(f"[ERROR] Synthesis generation failed: {e}")
-            return {
-                "status_summary": "Could not generate synthesis.",
-                "key_trends": [],
-                "doctor_precis": "AI Synthesis unavailable.",
-                "wellness_tips": [
-                    {"title": "Nutrition", "content": "Maintain a balanced diet."},
-                    {"title": "Hydration", "content": "Stay well hydrated."},
-                    {"title": "Follow-up", "content": "Consult your doctor for next steps."}
-                ]
-            }
+            logger.error("Synthesis streaming failed: %s", e)
+
+        if not parser.done:
+            # Fill whatever the model did not deliver with the unavailable placeholders
+            for field, value in SYNTHESIS_UNAVAILABLE.items():
+                if field not in result:
+                    yield {"field": field, "value": value}
+            yield {"complete": False}
+            return
+
+        await self._remember(cache_key, result, embedding)
+        yield {"complete": True}
@@ -1,9 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, BackgroundTasks, Request
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, BackgroundTasks, Request, Response
+from fastapi.responses import ORJSONResponse
 from typing import List, Dict, Any, Optional
+from app.core.config import settings
+from app.core.dependencies import get_report_service
 from app.core.security import get_current_user, get_admin_user, get_service_supabase_client
-from app.services.report_service import ReportService
+from app.services.report_service import (
+    ReportService,
+    after_report_cursor,
+    decode_report_cursor,
+    encode_report_cursor,
+)
+from app.utils.uploads import read_upload_capped
+import asyncio
+import hashlib
 import logging
-import traceback
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +23,13 @@ router = APIRouter(
     dependencies=[Depends(get_current_user), Depends(get_admin_user)]
 )
 
+def _normalize_auth_user(u) -> tuple:
+    """(id, email, created_at, email_confirmed_at) from a gotrue User object or dict"""
+    if isinstance(u, dict):
+        return u.get("id"), u.get("email") or "No Email", u.get("created_at"), u.get("email_confirmed_at")
+    return u.id, u.email or "No Email", u.created_at, u.email_confirmed_at
+
+
 @router.get("/users", response_model=List[Dict[str, Any]])
 async def list_registered_users(
     admin_user: dict = Depends(get_admin_user)
@@ -21,58 +38,54 @@ async def list_registered_users(
     List all registered users from auth and profiles.
     Requires Admin privileges.
     """
-    print("[ADMIN DEBUG] Entering list_registered_users...")
+    logger.debug("Entering list_registered_users")
     try:
         supabase = get_service_supabase_client()
         
-        # 1. Fetch Profiles
-        profiles_res = supabase.table("profiles").select("*").execute()
-        profiles_list = profiles_res.data or []
-        profiles = {p["id"]: p for p in profiles_list if "id" in p}
-        print(f"[ADMIN DEBUG] Found {len(profiles)} profiles in DB")
+        # 1. Fetch Profiles and Auth Users concurrently (independent round trips)
+        profiles_res, auth_users_res = await asyncio.gather(
+            asyncio.to_thread(lambda: supabase.table("profiles").select("*").execute()),
+            asyncio.to_thread(supabase.auth.admin.list_users),
+            return_exceptions=True
+        )
+        if isinstance(profiles_res, Exception):
+            raise profiles_res
+
+        profiles = {p["id"]: p for p in (profiles_res.data or []) if "id" in p}
+        logger.debug("Found %d profiles in DB", len(profiles))
         
-        # 2. Fetch Auth Users
+        # 2. Normalize Auth Users
         auth_users = []
-        try:
-            auth_users_res = supabase.auth.admin.list_users()
-            # Handle different response formats
-            if isinstance(auth_users_res, list):
-                auth_users = auth_users_res
-            elif hasattr(auth_users_res, "users"):
-                auth_users = auth_users_res.users
-            elif isinstance(auth_users_res, dict) and "users" in auth_users_res:
-                auth_users = auth_users_res["users"]
-        except Exception as auth_err:
-            print(f"[ADMIN WARNING] Auth fetch failed: {auth_err}")
+        if isinstance(auth_users_res, Exception):
+            logger.warning("Auth fetch failed: %s", auth_users_res)
+        # Handle different response formats
+        elif isinstance(auth_users_res, list):
+            auth_users = auth_users_res
+        elif hasattr(auth_users_res, "users"):
+            auth_users = auth_users_res.users
+        elif isinstance(auth_users_res, dict) and "users" in auth_users_res:
+            auth_users = auth_users_res["users"]
 
-        print(f"[ADMIN DEBUG] Found {len(auth_users)} auth users")
+        logger.debug("Found %d auth users", len(auth_users))
 
-        # 3. Combine Data
-        combined_users = []
-        
-        if auth_users:
-            for u in auth_users:
-                # Handle both object and dict
-                u_id = getattr(u, "id", None) or (u.get("id") if isinstance(u, dict) else None)
-                u_email = getattr(u, "email", "No Email") or (u.get("email") if isinstance(u, dict) else "No Email")
-                u_created = getattr(u, "created_at", None) or (u.get("created_at") if isinstance(u, dict) else None)
-                u_confirmed = getattr(u, "email_confirmed_at", None) or (u.get("email_confirmed_at") if isinstance(u, dict) else None)
-                
-                if not u_id: continue
-                
-                profile = profiles.get(u_id, {})
-                combined_users.append({
-                    "id": u_id,
-                    "email": u_email,
-                    "full_name": profile.get("full_name"),
-                    "phone_number": profile.get("phone_number"),
-                    "created_at": str(u_created) if u_created else None,
-                    "status": "active" if u_confirmed else "pending"
-                })
+        # 3. Combine Data in a single pass
+        empty = {}
+        combined_users = [
+            {
+                "id": u_id,
+                "email": u_email,
+                "full_name": profiles.get(u_id, empty).get("full_name"),
+                "phone_number": profiles.get(u_id, empty).get("phone_number"),
+                "created_at": str(u_created) if u_created else None,
+                "status": "active" if u_confirmed else "pending"
+            }
+            for u_id, u_email, u_created, u_confirmed in map(_normalize_auth_user, auth_users)
+            if u_id
+        ]
         
         # 4. Fallback if combined list is empty but profiles exist
         if not combined_users and profiles:
-            print("[ADMIN DEBUG] Combined list empty, using profiles fallback")
+            logger.debug("Combined list empty, using profiles fallback")
             for p_id, p in profiles.items():
                 combined_users.append({
                     "id": p_id,
@@ -83,12 +96,11 @@ async def list_registered_users(
                     "status": "profile_only"
                 })
             
-        print(f"[ADMIN DEBUG] Final user count: {len(combined_users)}")
+        logger.debug("Final user count: %d", len(combined_users))
         return combined_users
         
     except Exception as e:
-        print(f"[ADMIN ERROR] {e}")
-        traceback.print_exc()
+        logger.exception("Admin list error: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Admin list error: {str(e)}"
@@ -101,15 +113,15 @@ async def upload_report_as_admin(
     file: UploadFile = File(...),
     report_type: Optional[str] = None,
     background_tasks: BackgroundTasks = BackgroundTasks(),
-    admin_user: dict = Depends(get_admin_user)
+    admin_user: dict = Depends(get_admin_user),
+    service: ReportService = Depends(get_report_service),
 ):
     """Upload a report on behalf of a user"""
-    if file.content_type not in ["image/jpeg", "image/png", "image/jpg", "image/webp"]:
+    if file.content_type not in settings.ALLOWED_IMAGE_TYPES:
         raise HTTPException(status_code=400, detail="Invalid file type")
 
-    image_data = await file.read()
+    image_data = await read_upload_capped(request, file)
     try:
-        service = ReportService(request)
         report_id = await service.create_report(
             user_id=target_user_id,
             image_data=image_data,
@@ -121,24 +133,61 @@ async def upload_report_as_admin(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _report_page_response(request: Request, query, limit: int, cursor: Optional[str]) -> Response:
+    """
+    One newest-first page of a reports query, keyset-paged on (created_at, id).
+    The cursor for the next page is returned in the X-Next-Cursor header, so the body stays a plain list.
+    """
+    if cursor:
+        try:
+            query = after_report_cursor(query, decode_report_cursor(cursor))
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    # One extra row tells whether another page exists
+    res = query.order("created_at", desc=True).order("id", desc=True).limit(limit + 1).execute()
+    rows = res.data or []
+    reports = rows[:limit]
+
+    # Every row's version goes into the ETag, so a status change on any of them is never answered with a 304
+    digest = hashlib.blake2b(digest_size=8)
+    for r in reports:
+        digest.update(f"{r['id']}:{r.get('status')}:{r.get('updated_at')}|".encode())
+    etag = f'W/"{digest.hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=15"}
+    if len(rows) > limit:
+        headers["X-Next-Cursor"] = encode_report_cursor(reports[-1])
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return ORJSONResponse(content=reports, headers=headers)
+
 @router.get("/all-reports")
 async def list_all_reports_as_admin(
+    request: Request,
     admin_user: dict = Depends(get_admin_user),
-    limit: int = 50
+    limit: int = 50,
+    cursor: Optional[str] = None
 ):
+    """Newest reports first; pass the X-Next-Cursor response header as cursor for the next page"""
     supabase = get_service_supabase_client()
-    res = supabase.table("reports").select("*").order("created_at", desc=True).limit(limit).execute()
-    return res.data or []
+    query = supabase.table("reports").select("*")
+    return _report_page_response(request, query, limit, cursor)
 
 @router.get("/users/{target_user_id}/reports")
-async def list_user_reports_as_admin(target_user_id: str, admin_user: dict = Depends(get_admin_user)):
+async def list_user_reports_as_admin(
+    target_user_id: str,
+    request: Request,
+    admin_user: dict = Depends(get_admin_user),
+    limit: int = 50,
+    cursor: Optional[str] = None
+):
     supabase = get_service_supabase_client()
-    res = supabase.table("reports").select("*").eq("user_id", target_user_id).execute()
-    return res.data or []
+    query = supabase.table("reports").select("*").eq("user_id", target_user_id)
+    return _report_page_response(request, query, limit, cursor)
 
 @router.delete("/reports/{report_id}")
 async def delete_report_as_admin(report_id: str, admin_user: dict = Depends(get_admin_user)):
     supabase = get_service_supabase_client()
-    supabase.table("report_parameters").delete().eq("report_id", report_id).execute()
+    # report_parameters, report_explanations, chat_messages and report_summaries
+    # all reference reports ON DELETE CASCADE, so one delete removes them atomically
     supabase.table("reports").delete().eq("id", report_id).execute()
     return {"status": "deleted"}
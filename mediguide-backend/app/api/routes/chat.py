@@ -2,8 +2,10 @@
 Chatbot API routes
 """
 from fastapi import APIRouter, Depends, HTTPException, status
-from app.core.dependencies import get_user_id
+from app.core.dependencies import get_chatbot_service, get_report_service, get_user_id
 from app.services.chat_service import ChatService
+from app.services.chatbot_service import ChatbotService
+from app.services.report_service import ReportService
 from app.schemas.chat import ChatMessageRequest, ChatMessageResponse, ChatHistoryResponse
 
 router = APIRouter(prefix="/chat", tags=["chat"])
@@ -13,7 +15,9 @@ router = APIRouter(prefix="/chat", tags=["chat"])
 async def send_message(
     report_id: str,
     request: ChatMessageRequest,
-    user_id: str = Depends(get_user_id)
+    user_id: str = Depends(get_user_id),
+    report_service: ReportService = Depends(get_report_service),
+    chatbot_service: ChatbotService = Depends(get_chatbot_service)
 ):
     """Send a message to the chatbot"""
     if request.report_id != report_id:
@@ -22,7 +26,7 @@ async def send_message(
             detail="Report ID mismatch"
         )
     
-    service = ChatService()
+    service = ChatService(report_service, chatbot_service)
     try:
         message_data = await service.send_message(
             user_id=user_id,
@@ -40,10 +44,12 @@ async def send_message(
 @router.get("/reports/{report_id}/history", response_model=ChatHistoryResponse)
 async def get_chat_history(
     report_id: str,
-    user_id: str = Depends(get_user_id)
+    user_id: str = Depends(get_user_id),
+    report_service: ReportService = Depends(get_report_service),
+    chatbot_service: ChatbotService = Depends(get_chatbot_service)
 ):
     """Get chat history for a report"""
-    service = ChatService()
+    service = ChatService(report_service, chatbot_service)
     history = await service.get_chat_history(report_id, user_id)
     
     return ChatHistoryResponse(
@@ -1,9 +1,11 @@
 """
 Chatbot API Routes
 """
-from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
+from app.core.dependencies import get_chatbot_service, get_report_service
 from app.core.security import get_current_user
 from app.services.chatbot_service import ChatbotService
 from app.services.report_service import ReportService
@@ -20,34 +22,25 @@ class ChatResponse(BaseModel):
 @router.post("/ask", response_model=ChatResponse)
 async def ask_chatbot(
     payload: ChatRequest,
-    request: Request,
-
+    report_service: ReportService = Depends(get_report_service),
+    chatbot_service: ChatbotService = Depends(get_chatbot_service),
     current_user: dict = Depends(get_current_user)
 ):
     user_id = current_user["user_id"]
     """
     Ask MediBot a question about a report.
     """
-    # 1. Initialize Services
-    report_service = ReportService(request)
-    chatbot_service = ChatbotService()
-    
-    # 2. Verify Access & Fetch Data
-    # get_report checks ownership/family access internally
-    report = await report_service.get_report(payload.report_id, user_id)
-    if not report:
+    # 2. Verify Access & Fetch Report, Parameters and Explanations in one query
+    # get_report_with_context checks ownership/family access internally
+    context = await report_service.get_report_with_context(payload.report_id, user_id)
+    if not context:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, 
             detail="Report not found or you do not have permission to view it"
         )
-        
-    # 3. Fetch Context (Parameters & Explanations)
-    # Note: Optimization - we could make a dedicated method in ReportService to fetch all in one DB call,
-    # but for v1 reusing existing methods is safer and cleaner as requested ("Do NOT refactor existing code")
-    parameters = await report_service.get_report_parameters(payload.report_id, user_id)
-    explanations = await report_service.get_report_explanations(payload.report_id, user_id)
+    report, parameters, explanations = context
     
-    # 4. Generate Response
+    # 3. Generate Response
     answer = await chatbot_service.generate_response(
         question=payload.question,
         report_data=report,
@@ -57,3 +50,34 @@ async def ask_chatbot(
     )
     
     return ChatResponse(response=answer)
+
+
+@router.post("/ask/stream")
+async def ask_chatbot_stream(
+    payload: ChatRequest,
+    report_service: ReportService = Depends(get_report_service),
+    chatbot_service: ChatbotService = Depends(get_chatbot_service),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Ask MediBot a question and stream the answer as plain text while it is generated.
+    """
+    user_id = current_user["user_id"]
+    context = await report_service.get_report_with_context(payload.report_id, user_id)
+    if not context:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Report not found or you do not have permission to view it"
+        )
+    report, parameters, explanations = context
+
+    return StreamingResponse(
+        chatbot_service.generate_response_stream(
+            question=payload.question,
+            report_data=report,
+            parameters=parameters,
+            explanations=explanations,
+            report_id=payload.report_id
+        ),
+        media_type="text/plain; charset=utf-8"
+    )
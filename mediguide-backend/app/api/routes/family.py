@@ -2,7 +2,7 @@
 Family connection API routes
 """
 from fastapi import APIRouter, Depends, HTTPException, status
-from app.core.dependencies import get_user_id, require_premium
+from app.core.dependencies import get_user_id, require_premium, get_family_service
 from app.services.family_service import FamilyService
 from app.schemas.family import (
     FamilyMemberResponse,
@@ -16,10 +16,10 @@ router = APIRouter(prefix="/family", tags=["family"])
 
 @router.get("/members", response_model=list[FamilyMemberResponse])
 async def list_family_members(
-    user_id: str = Depends(get_user_id)
+    user_id: str = Depends(get_user_id),
+    service: FamilyService = Depends(get_family_service)
 ):
     """List all family members"""
-    service = FamilyService()
     members = await service.list_family_members(user_id)
     return [FamilyMemberResponse(**member) for member in members]
 
@@ -27,10 +27,10 @@ async def list_family_members(
 @router.post("/invite")
 async def invite_family_member(
     request: InviteFamilyRequest,
-    user_id: str = Depends(get_user_id)
+    user_id: str = Depends(get_user_id),
+    service: FamilyService = Depends(get_family_service)
 ):
     """Send family connection invite (Premium feature for unlimited)"""
-    service = FamilyService()
     try:
         connection_id = await service.send_invite(
             user_id=user_id,
@@ -50,10 +50,10 @@ async def invite_family_member(
 async def rename_connection(
     connection_id: str,
     request: RenameConnectionRequest,
-    user_id: str = Depends(get_user_id)
+    user_id: str = Depends(get_user_id),
+    service: FamilyService = Depends(get_family_service)
 ):
     """Rename a family connection (set alias)"""
-    service = FamilyService()
     success = await service.rename_connection(
         connection_id=connection_id,
         user_id=user_id,
@@ -73,10 +73,10 @@ async def rename_connection(
 async def accept_connection(
     connection_id: str,
     request: AcceptConnectionRequest,
-    user_id: str = Depends(get_user_id)
+    user_id: str = Depends(get_user_id),
+    service: FamilyService = Depends(get_family_service)
 ):
     """Accept a family connection request"""
-    service = FamilyService()
     accepted = await service.accept_connection(
         connection_id=connection_id,
         user_id=user_id,
@@ -95,10 +95,10 @@ async def accept_connection(
 @router.delete("/connections/{connection_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def remove_connection(
     connection_id: str,
-    user_id: str = Depends(get_user_id)
+    user_id: str = Depends(get_user_id),
+    service: FamilyService = Depends(get_family_service)
 ):
     """Remove a family connection"""
-    service = FamilyService()
     removed = await service.remove_connection(connection_id, user_id)
     
     if not removed:
@@ -2,7 +2,7 @@
 Premium subscription API routes
 """
 from fastapi import APIRouter, Depends
-from app.core.dependencies import get_user_id
+from app.core.dependencies import get_user_id, get_premium_service
 from app.services.premium_service import PremiumService
 from app.schemas.premium import PremiumStatusResponse
 
@@ -11,12 +11,11 @@ router = APIRouter(prefix="/premium", tags=["premium"])
 
 @router.get("/status", response_model=PremiumStatusResponse)
 async def get_premium_status(
-    user_id: str = Depends(get_user_id)
+    user_id: str = Depends(get_user_id),
+    service: PremiumService = Depends(get_premium_service)
 ):
     """Get premium subscription status and usage"""
-    service = PremiumService()
-    is_premium = await service.check_subscription(user_id)
-    stats = await service.get_usage_stats(user_id)
+    is_premium, stats = await service.get_status(user_id)
     
     return PremiumStatusResponse(
         is_premium=is_premium,
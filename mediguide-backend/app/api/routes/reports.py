@@ -1,6 +1,11 @@
 """
 Report API routes
 """
+import hashlib
+import logging
+
+import orjson
+
 from fastapi import (
     APIRouter,
     Depends,
@@ -10,23 +15,43 @@ from fastapi import (
     File,
     BackgroundTasks,
     Request,
+    Response,
 )
+from fastapi.responses import StreamingResponse
 
-from app.core.dependencies import get_user_id, require_premium
+from app.core.config import settings
+from app.core.dependencies import get_user_id, get_report_service
 from app.services.report_service import ReportService
+from app.utils.uploads import read_upload_capped
 from app.schemas.report import (
     ReportUploadResponse,
     ReportResponse,
-    ReportListRequest,
     ReportStatusResponse,
-    CompareReportsRequest,
     TestParameterResponse,
+    ReportFullResponse,
 )
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from app.schemas.common import PaginatedResponse
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/reports", tags=["reports"])
 
+# Polled while a report is processing; a short window keeps progress fresh
+REPORT_CACHE_CONTROL = "private, max-age=2"
+
+
+def _report_validators(request: Request, response: Response, report: Dict[str, Any]) -> Optional[Response]:
+    """Tag the response with the report's version; returns a 304 when the client already has it"""
+    # Progress updates don't touch updated_at, so it is part of the version
+    version = f"{report.get('id')}:{report.get('updated_at')}:{report.get('status')}:{report.get('progress')}"
+    etag = f'W/"{hashlib.blake2b(version.encode(), digest_size=8).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": REPORT_CACHE_CONTROL}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
+
 
 @router.post(
     "/upload",
@@ -38,31 +63,20 @@ async def upload_report(
     file: UploadFile = File(...),
     report_type: Optional[str] = None,
     user_id: str = Depends(get_user_id),
+    service: ReportService = Depends(get_report_service),
     background_tasks: BackgroundTasks = BackgroundTasks(),
 ):
-    print(f"[DEBUG] Upload Endpoint Hit. Type: {report_type}, Filename: {file.filename}, Content-Type: {file.content_type}")
-    if file.content_type not in [
-        "image/jpeg",
-        "image/png",
-        "image/jpg",
-        "image/webp",
-    ]:
+    logger.debug("Upload hit. Type: %s, Filename: %s, Content-Type: %s", report_type, file.filename, file.content_type)
+    if file.content_type not in settings.ALLOWED_IMAGE_TYPES:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid file type",
         )
 
-    image_data = await file.read()
-
-    if len(image_data) > 10 * 1024 * 1024:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="File too large (max 10MB)",
-        )
+    # Rejects oversized uploads without buffering more than the limit
+    image_data = await read_upload_capped(request, file)
 
     try:
-        # Pass request to service layer to handle auth and background processing
-        service = ReportService(request)
         report_id = await service.create_report(
             user_id=user_id,
             image_data=image_data,
@@ -83,9 +97,7 @@ async def upload_report(
             detail=str(e),
         )
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        print(f"[ERROR IN UPLOAD]: {e}")
+        logger.exception("Report upload failed")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to process report: {str(e)}",
@@ -95,16 +107,21 @@ async def upload_report(
 @router.get("/{report_id}/status", response_model=ReportStatusResponse)
 async def get_report_status(
     request: Request,
+    response: Response,
     report_id: str,
     user_id: str = Depends(get_user_id),
+    service: ReportService = Depends(get_report_service),
 ):
-    service = ReportService(request)
     report = await service.get_report(report_id, user_id)
 
     if not report:
         raise HTTPException(status_code=404, detail="Report not found")
 
-    print(f"[DEBUG] Report {report_id} status: {report.get('status')}")
+    not_modified = _report_validators(request, response, report)
+    if not_modified:
+        return not_modified
+
+    logger.debug("Report %s status: %s", report_id, report.get("status"))
     return ReportStatusResponse(
         report_id=report_id,
         status=report.get("status", "processing"),
@@ -116,32 +133,36 @@ async def get_report_status(
 @router.get("/{report_id}", response_model=ReportResponse)
 async def get_report(
     request: Request,
+    response: Response,
     report_id: str,
     user_id: str = Depends(get_user_id),
+    service: ReportService = Depends(get_report_service),
 ):
-    service = ReportService(request)
     report = await service.get_report(report_id, user_id)
 
     if not report:
         raise HTTPException(status_code=404, detail="Report not found")
 
+    not_modified = _report_validators(request, response, report)
+    if not_modified:
+        return not_modified
+
     return ReportResponse(**report)
 
 
 @router.get("", response_model=PaginatedResponse)
 async def list_reports(
-    request: Request,
     search: Optional[str] = None,
     report_type: Optional[str] = None,
     flag_level: Optional[str] = None,
     time_range: str = "all",
     target_user_id: Optional[str] = None,
-    page: int = 1,
+    page: int = 1,  # Deprecated: use cursor
     limit: int = 20,
+    cursor: Optional[str] = None,
     user_id: str = Depends(get_user_id),
+    service: ReportService = Depends(get_report_service),
 ):
-    service = ReportService(request)
-    
     # Handle shared access
     fetch_user_id = user_id
     if target_user_id and target_user_id != user_id:
@@ -153,88 +174,130 @@ async def list_reports(
             )
         fetch_user_id = target_user_id
         
-    result = await service.list_reports(
-        user_id=fetch_user_id,
-        search=search,
-        report_type=report_type,
-        flag_level=flag_level,
-        time_range=time_range,
-        page=page,
-        limit=limit,
-    )
+    try:
+        result = await service.list_reports(
+            user_id=fetch_user_id,
+            search=search,
+            report_type=report_type,
+            flag_level=flag_level,
+            time_range=time_range,
+            page=page,
+            limit=limit,
+            cursor=cursor,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
     return PaginatedResponse(**result)
 
 
 @router.delete("/{report_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_report(
-    request: Request,
     report_id: str,
+    background_tasks: BackgroundTasks,
     user_id: str = Depends(get_user_id),
+    service: ReportService = Depends(get_report_service),
 ):
-    service = ReportService(request)
-    deleted = await service.delete_report(report_id, user_id)
+    deleted = await service.delete_report(report_id, user_id, background_tasks)
 
     if not deleted:
         raise HTTPException(status_code=404, detail="Report not found")
 
 
+@router.get("/{report_id}/full", response_model=ReportFullResponse)
+async def get_report_full(
+    report_id: str,
+    user_id: str = Depends(get_user_id),
+    service: ReportService = Depends(get_report_service),
+):
+    """
+    Report, parameters, explanations and synthesis in one call.
+    Replaces four sequential requests from the report detail screen.
+    """
+    full = await service.get_report_full(report_id, user_id)
+    if not full:
+        raise HTTPException(status_code=404, detail="Report not found")
+    return full
+
+
 @router.get("/{report_id}/parameters", response_model=List[TestParameterResponse])
 async def get_report_parameters(
-    request: Request,
     report_id: str,
     user_id: str = Depends(get_user_id),
+    service: ReportService = Depends(get_report_service),
 ):
-    service = ReportService(request)
     params = await service.get_report_parameters(report_id, user_id)
     return params
 
 
 @router.get("/{report_id}/explanations", response_model=list)
 async def get_report_explanations(
-    request: Request,
     report_id: str,
     user_id: str = Depends(get_user_id),
+    service: ReportService = Depends(get_report_service),
 ):
-    service = ReportService(request)
     explanations = await service.get_report_explanations(report_id, user_id)
     return explanations
 
 
 @router.get("/{report_id}/synthesis")
 async def get_report_synthesis(
-    request: Request,
     report_id: str,
     user_id: str = Depends(get_user_id),
+    service: ReportService = Depends(get_report_service),
 ):
     """
     Get AI synthesis for a report. 
     Reads from CACHE only. No real-time AI generation.
     """
-    service = ReportService(request)
     try:
         synthesis = await service.get_report_synthesis(report_id, user_id)
         return synthesis
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
-        print(f"[ERROR] Get synthesis failed: {e}")
+        logger.error("Get synthesis failed: %s", e)
         raise HTTPException(status_code=500, detail="Failed to retrieve synthesis")
 
 
+@router.get("/{report_id}/synthesis/stream")
+async def stream_report_synthesis(
+    report_id: str,
+    user_id: str = Depends(get_user_id),
+    service: ReportService = Depends(get_report_service),
+):
+    """
+    Stream AI synthesis as Server-Sent Events, one event per completed field:
+    data: {"field": "status_summary", "value": "..."}
+    """
+    report = await service.get_report(report_id, user_id)
+    if not report:
+        raise HTTPException(status_code=404, detail="Report not found")
+
+    async def events():
+        try:
+            async for item in service.stream_synthesis(report, user_id):
+                yield b"data: " + orjson.dumps(item, default=str) + b"\n\n"
+        except Exception as e:
+            logger.error("Synthesis stream failed: %s", e)
+            yield b'event: error\ndata: {"detail":"Failed to generate synthesis"}\n\n'
+        yield b"event: done\ndata: {}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
 @router.post("/{report_id}/generate-synthesis")
 async def generate_report_synthesis_trigger(
     report_id: str,
     background_tasks: BackgroundTasks,
-    request: Request,
     user_id: str = Depends(get_user_id),
+    service: ReportService = Depends(get_report_service),
 ):
     """
     Trigger background generation of AI synthesis.
     Safe and idempotent.
     """
     try:
-        service = ReportService(request)
         # Verify access first
         report = await service.get_report(report_id, user_id)
         if not report:
@@ -252,5 +315,5 @@ async def generate_report_synthesis_trigger(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[ERROR] Trigger synthesis failed: {e}")
+        logger.error("Trigger synthesis failed: %s", e)
         raise HTTPException(status_code=500, detail="Failed to trigger synthesis")
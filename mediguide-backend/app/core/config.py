@@ -1,9 +1,12 @@
 """
 Application configuration and environment variables
 """
-from pydantic import model_validator
-from pydantic_settings import BaseSettings
-from typing import Optional, Any
+import json
+import os
+from functools import cached_property, lru_cache
+from pydantic import field_validator, model_validator
+from pydantic_settings import BaseSettings, NoDecode, SettingsConfigDict
+from typing import Annotated, Optional, Any
 
 
 
@@ -14,27 +17,58 @@ class Settings(BaseSettings):
     SUPABASE_URL: Optional[str] = ""
     SUPABASE_ANON_KEY: Optional[str] = ""
     SUPABASE_SERVICE_ROLE_KEY: Optional[str] = ""
+    # Project JWT secret (Settings > API). When set, HS256 tokens are verified locally
+    SUPABASE_JWT_SECRET: Optional[str] = None
     
-    @model_validator(mode='after')
-    def clean_supabase_config(self):
-        if self.SUPABASE_URL and not self.SUPABASE_URL.endswith('/'):
-            self.SUPABASE_URL += '/'
-        if self.SUPABASE_ANON_KEY:
-            self.SUPABASE_ANON_KEY = self.SUPABASE_ANON_KEY.strip()
-        if self.SUPABASE_SERVICE_ROLE_KEY:
-            self.SUPABASE_SERVICE_ROLE_KEY = self.SUPABASE_SERVICE_ROLE_KEY.strip()
-        return self
+    @field_validator('SUPABASE_URL')
+    @classmethod
+    def clean_supabase_url(cls, v: Optional[str]) -> Optional[str]:
+        if v and not v.endswith('/'):
+            v += '/'
+        return v
+
+    @field_validator('SUPABASE_ANON_KEY', 'SUPABASE_SERVICE_ROLE_KEY', 'SUPABASE_JWT_SECRET')
+    @classmethod
+    def strip_supabase_keys(cls, v: Optional[str]) -> Optional[str]:
+        return v.strip() if v else v
     
     # OpenAI Configuration
     OPENAI_API_KEY: Optional[str] = None
     OPENAI_MODEL: str = "gpt-4o-mini"
     
+    # Explanation provider: "gemini" or "openai"
+    AI_PROVIDER: str = "gemini"
+
     # AI Fallback Settings
     CHAT_TOKEN_LIMIT: int = 800_000 # Fallback at 80% of 1M limit
+    CHAT_HISTORY_TOKEN_BUDGET: int = 800  # Prior turns re-sent with each question
+    CHAT_CONTEXT_CACHE_TTL_SECONDS: int = 3600
+    CHAT_RESPONSE_CACHE_TTL_SECONDS: int = 7 * 86_400
+    CHAT_STICKY_MODEL_TTL_SECONDS: int = 3600  # How long a report stays on OpenAI after Gemini fails
+
+    # LLM Timeouts & Retries
+    LLM_EXPLANATION_TIMEOUT_SECONDS: float = 15.0
+    LLM_CHAT_TIMEOUT_SECONDS: float = 20.0
+    LLM_CHAT_HEDGE_DELAY_SECONDS: float = 8.0  # Also ask OpenAI once Gemini takes this long (0 = never)
+    LLM_MAX_ATTEMPTS: int = 2  # First call plus one retry
+
+    # LLM Response Cache
+    LLM_CACHE_TTL_SECONDS: int = 86_400  # 24h
+    LLM_CACHE_MAX_ENTRIES: int = 10_000
+    SYNTHESIS_CACHE_TTL_DAYS: int = 30
+    # Reuse a synthesis for near-duplicate payloads (needs pgvector + OpenAI embeddings).
+    # Off by default: similar-looking payloads can still differ in clinically relevant values.
+    SYNTHESIS_SEMANTIC_CACHE_ENABLED: bool = False
+    SYNTHESIS_SEMANTIC_CACHE_MIN_SIMILARITY: float = 0.95
+    EMBEDDING_MODEL: str = "text-embedding-3-small"
 
     
     # OCR Configuration
     OCR_SERVICE: str = "tesseract"  # Options: tesseract, google_vision, aws_textract
+    OCR_MAX_CONCURRENCY: int = os.cpu_count() or 2  # Tesseract runs at once per process
+    OCR_MIN_INTERVAL_SECONDS: float = 0.0  # Minimum gap between OCR starts (0 = unpaced)
+    OCR_CACHE_TTL_SECONDS: int = 600  # Re-uploads of identical bytes reuse the extracted text
+    OCR_CACHE_MAX_ENTRIES: int = 1024
     GOOGLE_VISION_API_KEY: Optional[str] = None
     GOOGLE_API_KEY: Optional[str] = ""
     AWS_ACCESS_KEY_ID: Optional[str] = None
@@ -45,23 +79,26 @@ class Settings(BaseSettings):
     PROJECT_NAME: str = "MediGuide API"
     VERSION: str = "1.0.0"
     DEBUG: bool = False
+    LOG_LEVEL: str = "INFO"  # Use WARNING in production to silence per-request diagnostics
     
-    # CORS Settings
-    BACKEND_CORS_ORIGINS: list[str] = []
+    # CORS Settings (comma-separated or JSON list; raw string reaches the validator below)
+    BACKEND_CORS_ORIGINS: Annotated[list[str], NoDecode] = []
 
     @model_validator(mode='before')
     @classmethod
     def assemble_cors_origins(cls, v: dict[str, Any]) -> dict[str, Any]:
         if isinstance(v.get("BACKEND_CORS_ORIGINS"), str) and not v.get("BACKEND_CORS_ORIGINS", "").startswith("["):
-            v["BACKEND_CORS_ORIGINS"] = [i.strip() for i in v["BACKEND_CORS_ORIGINS"].split(",")]
-        elif isinstance(v.get("BACKEND_CORS_ORIGINS"), (list, str)):
-             # Let Pydantic handle lists or JSON strings
-             pass
+            v["BACKEND_CORS_ORIGINS"] = [i.strip() for i in v["BACKEND_CORS_ORIGINS"].split(",") if i.strip()]
+        elif isinstance(v.get("BACKEND_CORS_ORIGINS"), str):
+            v["BACKEND_CORS_ORIGINS"] = json.loads(v["BACKEND_CORS_ORIGINS"])
         return v
     
-    @property
+    @cached_property
     def CORS_ORIGINS(self) -> list[str]:
-        """Combine defaults with env vars"""
+        """
+        Local dev origins plus BACKEND_CORS_ORIGINS (settings are frozen, so built once).
+        Deployed frontends are configured only through the environment.
+        """
         defaults = [
             "http://localhost:8080",
             "http://localhost:3000",
@@ -72,11 +109,9 @@ class Settings(BaseSettings):
         ]
         return defaults + self.BACKEND_CORS_ORIGINS
 
-    # File Upload Settings
-    
     # File Upload Settings
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10MB
-    ALLOWED_IMAGE_TYPES: list[str] = ["image/jpeg", "image/png", "image/jpg", "image/webp"]
+    ALLOWED_IMAGE_TYPES: frozenset[str] = frozenset({"image/jpeg", "image/png", "image/jpg", "image/webp"})
     
     # Supabase Storage
     STORAGE_BUCKET: str = "medical-reports"
@@ -84,15 +119,30 @@ class Settings(BaseSettings):
     # Background Processing
     USE_CELERY: bool = False  # Set to True for production with Redis
     CELERY_BROKER_URL: Optional[str] = None
+    REPORT_WORKER_CONCURRENCY: int = 4  # Reports processed at once per process
+    REPORT_QUEUE_MAX_SIZE: int = 100  # Uploads wait for a slot beyond this
+    REPORT_QUEUE_DRAIN_SECONDS: float = 25.0  # Shutdown waits this long for queued reports to finish
     
     # Rate Limiting
     FREE_TIER_REPORTS_PER_MONTH: int = 3
     FREE_TIER_FAMILY_MEMBERS: int = 2
+
+    # Short-lived caches for endpoints polled by the frontend
+    FAMILY_MEMBERS_CACHE_TTL_SECONDS: int = 10
+    PREMIUM_STATUS_CACHE_TTL_SECONDS: int = 60
     
-    class Config:
-        env_file = ".env"
-        case_sensitive = True
-        extra = "ignore"
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        case_sensitive=True,
+        extra="ignore",
+        frozen=True,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Process-wide settings, parsed from the environment once"""
+    return Settings()
 
 
-settings = Settings()
+settings = get_settings()
@@ -1,10 +1,14 @@
 """
 FastAPI dependencies for dependency injection
 """
-from fastapi import Depends, HTTPException, status
+from functools import lru_cache
+from fastapi import Depends, HTTPException, Request, status
 from typing import Optional
 from app.core.security import get_current_user, get_supabase_client
 from app.services.premium_service import PremiumService
+from app.services.family_service import FamilyService
+from app.services.chatbot_service import ChatbotService
+from app.services.report_service import ReportService
 
 
 async def get_user_id(user: dict = Depends(get_current_user)) -> str:
@@ -12,8 +16,33 @@ async def get_user_id(user: dict = Depends(get_current_user)) -> str:
     return user["user_id"]
 
 
+# Stateless services are built once and shared across requests
+@lru_cache(maxsize=1)
+def get_premium_service() -> PremiumService:
+    return PremiumService()
+
+
+@lru_cache(maxsize=1)
+def get_family_service() -> FamilyService:
+    return FamilyService()
+
+
+@lru_cache(maxsize=1)
+def get_chatbot_service() -> ChatbotService:
+    return ChatbotService()
+
+
+def get_report_service(request: Request) -> ReportService:
+    """
+    Per-request ReportService bound to the caller's JWT.
+    FastAPI caches dependencies per request, so every consumer shares one instance.
+    """
+    return ReportService(request)
+
+
 async def require_premium(
-    user_id: str = Depends(get_user_id)
+    user_id: str = Depends(get_user_id),
+    premium_service: PremiumService = Depends(get_premium_service)
 ) -> bool:
     """
     Dependency to enforce premium subscription requirement
@@ -21,7 +50,6 @@ async def require_premium(
     Raises:
         HTTPException: 403 if user is not premium
     """
-    premium_service = PremiumService()
     is_premium = await premium_service.check_subscription(user_id)
     
     if not is_premium:
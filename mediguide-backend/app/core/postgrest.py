@@ -0,0 +1,80 @@
+"""
+Async PostgREST access for hot request paths.
+The supabase-py client is synchronous and blocks the event loop for the whole
+round trip; these clients speak to the same REST endpoint with awaitable queries.
+"""
+from functools import lru_cache
+
+import httpx
+from fastapi import Request
+from httpx import Headers
+from postgrest import AsyncPostgrestClient
+
+from app.core.config import settings
+from app.core.security import POSTGREST_LIMITS, bearer_token
+
+_async_sessions: list = []
+
+
+@lru_cache(maxsize=2)
+def get_async_postgrest(use_service_role: bool = False) -> AsyncPostgrestClient:
+    """
+    Shared async PostgREST client, one per key.
+    Like get_supabase_client, it carries no user JWT (RLS will NOT apply for the anon key).
+    """
+    key = settings.SUPABASE_SERVICE_ROLE_KEY if use_service_role else settings.SUPABASE_ANON_KEY
+    client = AsyncPostgrestClient(
+        f"{settings.SUPABASE_URL}rest/v1",
+        headers={"apikey": key, "Authorization": f"Bearer {key}"},
+    )
+    # Not opened yet, so swapping it out leaks nothing
+    session = client.session
+    client.session = httpx.AsyncClient(
+        base_url=session.base_url,
+        headers=session.headers,
+        timeout=session.timeout,
+        follow_redirects=True,
+        http2=True,
+        limits=POSTGREST_LIMITS,
+    )
+    _async_sessions.append(client.session)
+    return client
+
+
+class _AsyncBearerSession:
+    """The shared async HTTP session, sending one caller's JWT on every request"""
+
+    def __init__(self, session: httpx.AsyncClient, token: str):
+        self._session = session
+        self._authorization = f"Bearer {token}"
+
+    async def request(self, method, url, *, headers=None, **kwargs):
+        headers = Headers(headers)
+        headers["Authorization"] = self._authorization
+        return await self._session.request(method, url, headers=headers, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+class AuthedAsyncPostgrestClient:
+    """Per-request async PostgREST access bound to a user's JWT, over the shared pool"""
+
+    def __init__(self, base: AsyncPostgrestClient, token: str):
+        self.session = _AsyncBearerSession(base.session, token)
+
+    from_ = AsyncPostgrestClient.from_
+    table = AsyncPostgrestClient.table
+    rpc = AsyncPostgrestClient.rpc
+
+
+def get_authed_async_postgrest(request: Request) -> AuthedAsyncPostgrestClient:
+    """Async counterpart of get_authed_supabase_client; REQUIRED for RLS-protected reads"""
+    return AuthedAsyncPostgrestClient(get_async_postgrest(), bearer_token(request))
+
+
+async def close_async_postgrest():
+    """Close the shared async connection pools"""
+    while _async_sessions:
+        await _async_sessions.pop().aclose()
+    get_async_postgrest.cache_clear()
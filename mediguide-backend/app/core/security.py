@@ -2,43 +2,105 @@
 Security utilities for JWT verification and Supabase access
 """
 
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from functools import lru_cache
 from typing import Optional
 from fastapi import HTTPException, status, Header, Request, Depends
+import httpx
+from httpx import Headers
+from postgrest import SyncPostgrestClient
 from supabase import create_client, Client
-from supabase import create_client
 from app.core.config import settings
+from app.utils.cache import TTLCache
 import jwt
 
+logger = logging.getLogger(__name__)
+
+_BEARER_PREFIX_RE = re.compile(r"^bearer\s+", re.IGNORECASE)
+
 
 # -----------------------------
 # Supabase Client Helpers
 # -----------------------------
 
+# Pool for PostgREST traffic on the shared clients
+POSTGREST_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=30)
+_pooled_sessions: list = []
+WARM_UP_TIMEOUT_SECONDS = 5
+
+
+def _with_pool_limits(client: Client) -> Client:
+    """Replace the PostgREST session with one carrying explicit pool limits"""
+    session = client.postgrest.session
+    client.postgrest.session = httpx.Client(
+        base_url=session.base_url,
+        headers=session.headers,
+        timeout=session.timeout,
+        follow_redirects=True,
+        http2=True,
+        limits=POSTGREST_LIMITS,
+    )
+    session.close()
+    _pooled_sessions.append(client.postgrest.session)
+    return client
+
+
+@lru_cache(maxsize=2)
 def get_supabase_client(use_service_role: bool = False) -> Client:
     """
-    Returns a basic Supabase client.
+    Returns a basic Supabase client, shared per process (one per key).
     Does NOT attach user JWT (RLS will NOT work with this alone).
+    Never mutate its auth state; use get_authed_supabase_client for per-user access.
     """
     if use_service_role:
-        return create_client(
+        return _with_pool_limits(create_client(
             settings.SUPABASE_URL,
             settings.SUPABASE_SERVICE_ROLE_KEY
-        )
+        ))
 
-    return create_client(
+    return _with_pool_limits(create_client(
         settings.SUPABASE_URL,
         settings.SUPABASE_ANON_KEY
-    )
+    ))
 
 
-def get_authed_supabase_client(
-    request: Request,
-    use_service_role: bool = False
-) -> Client:
+class _BearerSession:
+    """The shared PostgREST HTTP session, sending one caller's JWT on every request"""
+
+    def __init__(self, session, token: str):
+        self._session = session
+        self._authorization = f"Bearer {token}"
+
+    def request(self, method, url, *, headers=None, **kwargs):
+        headers = Headers(headers)
+        headers["Authorization"] = self._authorization
+        return self._session.request(method, url, headers=headers, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+class AuthedPostgrestClient:
     """
-    Returns a Supabase client authenticated with the user's JWT.
-    REQUIRED for RLS-protected table access.
+    Per-request PostgREST access bound to a user's JWT.
+    Reuses the cached client's connection pool, so no client is built and
+    no auth state is shared between concurrent requests.
     """
+
+    def __init__(self, base: Client, token: str):
+        self.session = _BearerSession(base.postgrest.session, token)
+
+    from_ = SyncPostgrestClient.from_
+    table = SyncPostgrestClient.table
+    rpc = SyncPostgrestClient.rpc
+
+
+def bearer_token(request: Request) -> str:
+    """Extract the caller's JWT from the Authorization header"""
     auth_header = request.headers.get("Authorization")
 
     if not auth_header:
@@ -56,66 +118,139 @@ def get_authed_supabase_client(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid Authorization header format"
         )
+    return token
 
-    supabase = get_supabase_client(use_service_role=use_service_role)
 
-    # 🔥 THIS IS THE CRITICAL LINE (FIXES YOUR ISSUE)
-    supabase.postgrest.auth(token)
+def get_authed_supabase_client(
+    request: Request,
+    use_service_role: bool = False
+) -> AuthedPostgrestClient:
+    """
+    Returns a Supabase client authenticated with the user's JWT.
+    REQUIRED for RLS-protected table access.
+    """
+    # 🔥 THE USER JWT IS WHAT MAKES RLS APPLY
+    return AuthedPostgrestClient(get_supabase_client(use_service_role=use_service_role), bearer_token(request))
 
+def get_service_supabase_client():
+    """Service-role client; carries no per-user auth, so one instance is shared"""
+    return get_supabase_client(use_service_role=True)
 
-    return supabase
 
-def get_service_supabase_client():
-    return create_client(
-        settings.SUPABASE_URL,
-        settings.SUPABASE_SERVICE_ROLE_KEY,
+async def warm_supabase_clients():
+    """Open the shared PostgREST connections before the first request needs them"""
+    clients = []
+    if settings.SUPABASE_URL and settings.SUPABASE_ANON_KEY:
+        clients.append(get_supabase_client())
+    if settings.SUPABASE_URL and settings.SUPABASE_SERVICE_ROLE_KEY:
+        clients.append(get_service_supabase_client())
+
+    def ping(client: Client):
+        client.table("reports").select("id").limit(1).execute()
+
+    # Bounded so an unreachable database never holds up startup
+    results = await asyncio.gather(
+        *(asyncio.wait_for(asyncio.to_thread(ping, client), WARM_UP_TIMEOUT_SECONDS) for client in clients),
+        return_exceptions=True
     )
+    for result in results:
+        if isinstance(result, Exception):
+            logger.warning("Supabase warm-up failed: %r", result)
+
+
+def close_supabase_clients():
+    """Close the shared PostgREST connection pools"""
+    while _pooled_sessions:
+        _pooled_sessions.pop().close()
+    get_supabase_client.cache_clear()
 
 
 # -----------------------------
 # JWT Verification
 # -----------------------------
 
+# Verified claims per token, so repeat requests skip verification until expiry
+_verified_tokens = TTLCache(maxsize=4096, ttl=300)
+# Tokens verified remotely are re-checked sooner, since that path also catches revoked sessions
+REMOTE_VERIFY_CACHE_SECONDS = 60
+
+
+@lru_cache(maxsize=1)
+def _jwks_client() -> jwt.PyJWKClient:
+    """Signing keys for asymmetric Supabase tokens, fetched once and cached"""
+    return jwt.PyJWKClient(f"{settings.SUPABASE_URL}auth/v1/.well-known/jwks.json", cache_keys=True)
+
+
+def _decode_locally(token: str) -> Optional[dict]:
+    """Verify signature, expiry and audience without calling Supabase; None if not possible"""
+    algorithm = jwt.get_unverified_header(token).get("alg")
+    if algorithm == "HS256":
+        if not settings.SUPABASE_JWT_SECRET:
+            return None
+        key = settings.SUPABASE_JWT_SECRET
+    elif algorithm in ("RS256", "ES256"):
+        key = _jwks_client().get_signing_key_from_jwt(token).key
+    else:
+        return None
+    return jwt.decode(token, key, algorithms=[algorithm], audience="authenticated")
+
+
+def _decode_remotely(token: str) -> dict:
+    """Ask Supabase Auth to validate the token"""
+    response = get_supabase_client().auth.get_user(token)
+    if not response.user:
+        logger.debug("Supabase rejected token (no user returned)")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token"
+        )
+    # Identity comes from the verified user; the token is only read for its expiry (cache bound)
+    return {
+        "sub": response.user.id,
+        "email": response.user.email,
+        "role": response.user.role or "authenticated",
+        "exp": jwt.decode(token, options={"verify_signature": False}).get("exp", 0)
+    }
+
+
 async def verify_jwt_token(token: str) -> dict:
     """
     Verify Supabase JWT token and return user info
     """
-    try:
-        supabase = get_supabase_client()
-
-        # Safest verification method
-        response = supabase.auth.get_user(token)
-
-        if not response.user:
-            print("[AUTH DEBUG] Supabase rejected token (no user returned)")
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token"
-            )
-
-        # Optional: Print decoded for verification of audience
-        decoded = jwt.decode(
-            token,
-            options={"verify_signature": False}
-        )
-        print(f"[AUTH DEBUG] Token Decoded: {decoded}")
+    cache_key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    user = _verified_tokens.get(cache_key)
+    if user is not None:
+        return user
 
-        return {
-            "user_id": decoded.get("sub"),
-            "email": decoded.get("email"),
-            "role": decoded.get("role", "authenticated")
-        }
+    try:
+        # Local verification needs no network once keys are cached; JWKS fetches happen off the loop
+        decoded = await asyncio.to_thread(_decode_locally, token)
+        cache_seconds = None
+        if decoded is None:
+            decoded = await asyncio.to_thread(_decode_remotely, token)
+            cache_seconds = REMOTE_VERIFY_CACHE_SECONDS
 
     except Exception as e:
-        print(f"[AUTH DEBUG] Token verification failed: {str(e)}")
-        # Print Supabase URL to confirm environment
-        print(f"[AUTH DEBUG] Checking against Supabase URL: {settings.SUPABASE_URL}")
-        
+        logger.debug("Token verification failed against %s: %s", settings.SUPABASE_URL, e)
+
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Token verification failed: {str(e)}"
         )
 
+    user = {
+        "user_id": decoded.get("sub"),
+        "email": decoded.get("email"),
+        "role": decoded.get("role", "authenticated")
+    }
+    # Never cache past the token's own expiry
+    ttl = decoded.get("exp", 0) - time.time()
+    if cache_seconds is not None:
+        ttl = min(ttl, cache_seconds)
+    if ttl > 0:
+        _verified_tokens.set(cache_key, user, ttl=min(ttl, _verified_tokens.ttl))
+    return user
+
 
 # -----------------------------
 # FastAPI Dependency
@@ -134,8 +269,7 @@ async def get_current_user(
         )
 
     # Safe, case-insensitive token extraction
-    import re
-    token = re.sub(r"^bearer\s+", "", authorization, flags=re.IGNORECASE).strip()
+    token = _BEARER_PREFIX_RE.sub("", authorization).strip()
 
     return await verify_jwt_token(token)
 
@@ -3,17 +3,59 @@ MediGuide FastAPI Application
 Production-grade backend for medical report analysis
 """
 
+import asyncio
 import logging
-from fastapi import FastAPI, Request, UploadFile, File
+import os
+import sys
+import traceback
+from contextlib import asynccontextmanager
+from typing import BinaryIO, List
+import pytesseract
+from PIL import Image
+from fastapi import Depends, FastAPI, HTTPException, Request, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
 from app.core.config import settings
 from app.api.routes import reports, chat, family, premium, chatbot, admin
+from app.ai._clients import close_clients
+from app.core.security import warm_supabase_clients, close_supabase_clients, get_admin_user, verify_jwt_token
+from app.core.postgrest import close_async_postgrest
+from app.services.job_queue import report_job_queue
+from app.utils.uploads import UploadSizeLimitMiddleware
+from app.utils.image_processing import binarize_for_ocr
+from app.utils.ocr import (
+    TESSERACT_LOCATIONS_CHECKED,
+    TESSERACT_ON_PATH,
+    close_ocr_executor,
+    image_to_string,
+    ocr_cache_key,
+    ocr_text_cache,
+    run_ocr,
+    tesseract_version,
+    tesserocr,
+)
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=settings.LOG_LEVEL.upper())
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application startup/shutdown"""
+    # Open pooled database connections before serving traffic
+    await warm_supabase_clients()
+    report_job_queue.start()
+    yield
+    await report_job_queue.stop()
+    close_supabase_clients()
+    await close_async_postgrest()
+    # Release pooled LLM connections
+    await close_clients()
+    close_ocr_executor()
+
+
 # Create FastAPI app
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -21,15 +63,23 @@ app = FastAPI(
     description="MediGuide AI - Medical Report Analysis API",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
+    # orjson encodes response bodies several times faster than the stdlib encoder
+    default_response_class=ORJSONResponse,
 )
 
+# Reject oversized uploads from their headers, before the multipart body is parsed.
+# Added first so CORS headers are still applied to the 413
+app.add_middleware(UploadSizeLimitMiddleware)
+
 # CORS middleware - use settings to allow environment configuration
+# (extra frontend origins come from BACKEND_CORS_ORIGINS)
 app.add_middleware(
     CORSMiddleware,
-    allow_origins="*",
+    allow_origins=settings.CORS_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
+    allow_headers=["Authorization", "Content-Type"],
     expose_headers=["*"],
 )
 
@@ -41,8 +91,6 @@ app.include_router(premium.router, prefix=settings.API_V1_PREFIX)
 app.include_router(chatbot.router, prefix=settings.API_V1_PREFIX)
 app.include_router(admin.router, prefix=settings.API_V1_PREFIX)
 
-from pydantic import BaseModel
-
 
 class TokenCheck(BaseModel):
     token: str
@@ -52,8 +100,6 @@ class TokenCheck(BaseModel):
 async def debug_token_check(body: TokenCheck):
     """Temporary debug endpoint to test token verification logic"""
     try:
-        from app.core.security import verify_jwt_token
-
         user = await verify_jwt_token(body.token)
         return {
             "status": "valid",
@@ -68,67 +114,67 @@ async def debug_token_check(body: TokenCheck):
         }
 
 
-@app.post("/api/v1/debug/ocr")
-async def debug_ocr(file: UploadFile = File(...)):
-    """Diagnostic endpoint to test Tesseract directly on the server."""
-    import pytesseract
-    import shutil
-    import os
-    from PIL import Image
-    import io
-    import sys
+# Images accepted by one /debug/ocr/batch request
+DEBUG_OCR_BATCH_MAX_FILES = 20
+
 
+def _debug_ocr_cache_key(upload: BinaryIO, preprocess: bool) -> tuple:
+    """Reads the spooled upload; blocking, run it in a worker thread"""
+    return ocr_cache_key("debug-binarized" if preprocess else "debug", upload)
+
+
+def _debug_decode_and_ocr(upload: BinaryIO, preprocess: bool) -> tuple:
+    """(image size, text) for a spooled upload; CPU-bound, run it in a worker thread"""
+    # PIL reads straight from the spooled file, so the upload is never copied into one bytes object
+    upload.seek(0)
+    image = Image.open(upload)
+    size = image.size
+    if preprocess:
+        image = binarize_for_ocr(image)
+    return size, image_to_string(image)
+
+
+@app.post("/api/v1/debug/ocr")
+async def debug_ocr(file: UploadFile = File(...), preprocess: bool = False):
+    """
+    Diagnostic endpoint to test Tesseract directly on the server.
+    With preprocess=true the image is binarized (grayscale + Otsu) before OCR.
+    """
     response_data = {
         "status": "pending",
         "env_path": os.environ.get("PATH", ""),
         "python_executable": sys.executable,
         "cwd": os.getcwd(),
-        "tesseract_locations_checked": {},
-        "shutil_which_tesseract": str(shutil.which("tesseract")),
+        # Probed once at startup
+        "tesseract_locations_checked": TESSERACT_LOCATIONS_CHECKED,
+        "shutil_which_tesseract": str(TESSERACT_ON_PATH),
     }
 
     try:
         # 1. Log Request
         logger.info(f"Debug OCR request received for file: {file.filename}")
 
-        # 2. Check manually in common paths
-        common_paths = [
-            "/usr/bin/tesseract",
-            "/usr/local/bin/tesseract",
-            "/nix/var/nix/profiles/default/bin/tesseract",
-            "/bin/tesseract",
-        ]
-
-        found_binary = None
-        for p in common_paths:
-            exists = os.path.exists(p)
-            response_data["tesseract_locations_checked"][p] = exists
-            if exists:
-                found_binary = p
-
-        # 3. Try to configure pytesseract if we found it
-        if found_binary and not shutil.which("tesseract"):
-            pytesseract.pytesseract.tesseract_cmd = found_binary
-            response_data["manual_path_configured"] = found_binary
-
-        # 4. Check Tesseract Version/Path (After potential fix)
-        try:
-            version = pytesseract.get_tesseract_version()
-            cli_path = pytesseract.pytesseract.tesseract_cmd
-        except Exception as e:
-            version = f"Error: {e}"
-            cli_path = "Unknown"
-
-        response_data["tesseract_version"] = str(version)
-        response_data["tesseract_cmd_final"] = str(cli_path)
+        # 2. Tesseract binary was resolved at import (PATH first, then common install paths)
+        cli_path = pytesseract.pytesseract.tesseract_cmd
+        if not TESSERACT_ON_PATH and cli_path != "tesseract":
+            response_data["manual_path_configured"] = cli_path
 
-        # 5. Read Image
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
-        response_data["image_size"] = image.size
+        # 3. Version is probed once per process; the first probe spawns the CLI, so off the loop
+        response_data["tesseract_version"] = await asyncio.to_thread(tesseract_version)
+        response_data["tesseract_cmd_final"] = str(cli_path)
 
-        # 6. Run OCR
-        text = pytesseract.image_to_string(image)
+        # 4. Image stays in Starlette's spooled temp file (on disk past 1MB)
+        # 5. Run OCR (persistent engine when tesserocr is installed).
+        # Decoding and OCR are CPU-bound, so both run in a worker thread
+        response_data["ocr_engine"] = "tesserocr" if tesserocr else "pytesseract"
+        response_data["preprocessed"] = preprocess
+        cache_key = await asyncio.to_thread(_debug_ocr_cache_key, file.file, preprocess)
+        cached = ocr_text_cache.get(cache_key)
+        response_data["ocr_cached"] = cached is not None
+        if cached is None:
+            cached = await run_ocr(_debug_decode_and_ocr, file.file, preprocess)
+            ocr_text_cache.set(cache_key, cached)
+        response_data["image_size"], text = cached
 
         response_data["status"] = "success"
         response_data["extracted_text_preview"] = (
@@ -139,14 +185,63 @@ async def debug_ocr(file: UploadFile = File(...)):
         return response_data
 
     except Exception as e:
-        import traceback
-
         response_data["status"] = "failed"
         response_data["error"] = str(e)
         response_data["traceback"] = traceback.format_exc()
         return response_data
 
 
+@app.post("/api/v1/debug/ocr/batch", dependencies=[Depends(get_admin_user)])
+async def debug_ocr_batch(files: List[UploadFile] = File(...), preprocess: bool = False):
+    """
+    OCR several images in one request. Admin only: a batch can occupy every OCR slot.
+    Uncached images go through a single OCR thread, so they share one Tesseract engine.
+    """
+    if len(files) > DEBUG_OCR_BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {DEBUG_OCR_BATCH_MAX_FILES} files per batch")
+
+    keys = await asyncio.to_thread(lambda: [_debug_ocr_cache_key(f.file, preprocess) for f in files])
+    outcomes = [ocr_text_cache.get(k) for k in keys]
+    cached = [outcome is not None for outcome in outcomes]
+    # Identical files in one batch are only read once
+    missing = {}
+    for i, outcome in enumerate(outcomes):
+        if outcome is None:
+            missing.setdefault(keys[i], i)
+
+    def ocr_missing() -> dict:
+        done = {}
+        for key, i in missing.items():
+            try:
+                done[key] = _debug_decode_and_ocr(files[i].file, preprocess)
+            except Exception as e:
+                done[key] = e
+        return done
+
+    if missing:
+        done = await run_ocr(ocr_missing)
+        for key, outcome in done.items():
+            if not isinstance(outcome, Exception):
+                ocr_text_cache.set(key, outcome)
+        outcomes = [done.get(key, outcome) for key, outcome in zip(keys, outcomes)]
+
+    results = []
+    for file, outcome, hit in zip(files, outcomes, cached):
+        if isinstance(outcome, Exception):
+            results.append({"filename": file.filename, "status": "failed", "error": str(outcome)})
+            continue
+        size, text = outcome
+        results.append({
+            "filename": file.filename,
+            "status": "success",
+            "ocr_cached": hit,
+            "image_size": size,
+            "extracted_text_preview": text[:500] if text else "No text extracted",
+            "full_text_length": len(text),
+        })
+    return {"preprocessed": preprocess, "results": results}
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -166,23 +261,23 @@ async def health_check():
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     """Global exception handler with proper logging"""
-    import traceback
+    # Log the full error traceback; the logging handler formats it only if the record is emitted
+    logger.exception("Unhandled exception: %s", exc, exc_info=exc)
 
-    # Log the full error traceback
-    error_traceback = traceback.format_exc()
-    logger.error(f"Unhandled exception: {str(exc)}\n{error_traceback}")
-    print(f"[ERROR] Unhandled exception: {str(exc)}")
-    print(f"[ERROR] Traceback:\n{error_traceback}")
+    if settings.DEBUG:
+        message = str(exc)
+        error_traceback = "".join(traceback.format_exception(exc))
+    else:
+        message = "An unexpected error occurred"
+        error_traceback = None
 
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={
             "error": "INTERNAL_SERVER_ERROR",
-            "message": str(exc)
-            if settings.DEBUG
-            else "An unexpected error occurred",
+            "message": message,
             "code": "INTERNAL_SERVER_ERROR",
-            "details": error_traceback if settings.DEBUG else None,
+            "details": error_traceback,
         },
     )
 
@@ -190,6 +285,8 @@ async def global_exception_handler(request: Request, exc: Exception):
 if __name__ == "__main__":
     import uvicorn
 
+    # loop/http stay "auto": uvloop and httptools are picked when installed (not on Windows).
+    # Worker count comes from WEB_CONCURRENCY (ignored in reload mode)
     uvicorn.run(
         "app.main:app", host="0.0.0.0", port=8000, reload=settings.DEBUG
     )
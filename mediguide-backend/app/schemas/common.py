@@ -37,3 +37,7 @@ class PaginatedResponse(BaseModel):
     limit: int
     has_next: bool
     has_prev: bool
+    # Opaque keyset cursor for the next page (pass as ?cursor=); None on the last page
+    next_cursor: Optional[str] = None
+    # True when total comes from the query planner rather than COUNT(*)
+    total_is_estimate: bool = False
@@ -2,7 +2,7 @@
 Pydantic models for report-related requests and responses
 """
 from pydantic import BaseModel, Field
-from typing import Optional, List, Literal
+from typing import Any, Dict, Optional, List, Literal
 from datetime import datetime
 
 
@@ -97,6 +97,14 @@ class ReportUploadResponse(BaseModel):
     message: str
 
 
+class ReportFullResponse(BaseModel):
+    """Report detail screen in one response: report, parameters, explanations and synthesis"""
+    report: ReportResponse
+    parameters: List[TestParameterResponse]
+    explanations: List[Dict[str, Any]]
+    synthesis: Dict[str, Any]
+
+
 # Update forward references
 TestParameterResponse.model_rebuild()
 ExplanationResponse.model_rebuild()
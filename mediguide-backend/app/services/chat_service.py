@@ -1,21 +1,27 @@
 """
 Chat service for report-context aware chatbot
 """
+import asyncio
 from typing import List, Dict, Optional
-from datetime import datetime
 import uuid
-from app.supabase.client import get_supabase
+import httpx
+from postgrest.exceptions import APIError
 from app.services.chatbot_service import ChatbotService
 from app.services.report_service import ReportService
+from app.utils.retry import retry_async
+
+# Dropped connections and timeouts are safe to retry: the row id is generated here,
+# so a retried insert whose first attempt did land hits the primary key instead of duplicating
+SUPABASE_TRANSIENT_ERRORS = (httpx.TransportError,)
+CHAT_INSERT_ATTEMPTS = 3
 
 
 class ChatService:
     """Service for chatbot conversations"""
     
-    def __init__(self):
-        self.supabase = get_supabase()
-        self.report_service = ReportService()
-        self.chatbot_service = ChatbotService()
+    def __init__(self, report_service: ReportService, chatbot_service: ChatbotService):
+        self.report_service = report_service
+        self.chatbot_service = chatbot_service
     
     async def send_message(
         self,
@@ -24,25 +30,24 @@ class ChatService:
         message: str
     ) -> Dict:
         """Send a message and get chatbot response"""
-        # Verify report ownership
-        report = await self.report_service.get_report(report_id, user_id)
-        if not report:
+        # Report context and history are independent, so fetch them concurrently;
+        # history is discarded unless the access check inside the context fetch passes
+        context, history = await asyncio.gather(
+            self.report_service.get_report_with_context(report_id, user_id),
+            self._load_history(report_id, user_id),
+        )
+        if not context:
             raise ValueError("Report not found")
-        
-        # Get report parameters for context
-        parameters = await self.report_service.get_report_parameters(report_id, user_id)
-        parameters_summary = ", ".join([p.get("name", "") for p in parameters[:5]])
-        
-        # Get chat history
-        history = await self.get_chat_history(report_id, user_id)
+        report, parameters, explanations = context
         
         # Generate response
         response_text = await self.chatbot_service.generate_response(
-            message=message,
-            report_id=report_id,
-            report_type=report.get("type", "Unknown"),
-            parameters_summary=parameters_summary,
-            chat_history=history
+            question=message,
+            report_data=report,
+            parameters=parameters,
+            explanations=explanations,
+            chat_history=history,
+            report_id=report_id
         )
         
         # Save message and response
@@ -53,12 +58,39 @@ class ChatService:
             "user_id": user_id,
             "message": message,
             "response": response_text,
-            "created_at": datetime.now().isoformat()
         }
         
-        self.supabase.table("chat_messages").insert(message_data).execute()
+        # created_at comes from the column's DEFAULT NOW(); the inserted row is returned with it
+        saved = await self._insert_message(message_data)
         
-        return message_data
+        return saved or message_data
+    
+    async def _insert_message(self, message_data: Dict) -> Optional[Dict]:
+        """Store one chat turn, retrying transient failures with jittered backoff"""
+        # Sent with the caller's JWT on the async client, so the insert policy applies
+        table = self.report_service.async_db.table("chat_messages")
+        attempts_made = 0
+
+        async def insert():
+            nonlocal attempts_made
+            attempts_made += 1
+            try:
+                return await table.insert(message_data).execute()
+            except APIError as e:
+                # A unique violation on a retry means an earlier attempt was committed
+                # and only its response was lost; return that row instead of failing
+                if attempts_made > 1 and e.code == "23505":
+                    return await table.select("*").eq("id", message_data["id"]).execute()
+                raise
+
+        response = await retry_async(
+            insert,
+            attempts=CHAT_INSERT_ATTEMPTS,
+            base_delay=0.1,
+            max_delay=2.0,
+            retry_on=SUPABASE_TRANSIENT_ERRORS
+        )
+        return response.data[0] if response.data else None
     
     async def get_chat_history(
         self,
@@ -72,12 +104,24 @@ class ChatService:
         if not report:
             return []
         
-        # Get messages
-        response = self.supabase.table("chat_messages").select("*").eq(
-            "report_id", report_id
-        ).eq("user_id", user_id).order(
-            "created_at", desc=False
-        ).limit(limit).execute()
+        return await self._load_history(report_id, user_id, limit)
+    
+    async def _load_history(
+        self,
+        report_id: str,
+        user_id: str,
+        limit: int = 50
+    ) -> List[Dict]:
+        """Fetch a user's messages for a report, without the access check"""
+        response = await (
+            self.report_service.async_db.table("chat_messages")
+            .select("message, response")
+            .eq("report_id", report_id)
+            .eq("user_id", user_id)
+            .order("created_at", desc=False)
+            .limit(limit)
+            .execute()
+        )
         
         # Format for chatbot
         history = []
@@ -1,10 +1,20 @@
-import json
+import asyncio
+import random
 import re
 import time
-from typing import Dict, List, Optional
-from openai import OpenAI
+import orjson
+from typing import AsyncIterator, Dict, List, Optional
 from app.core.config import settings
-from app.utils.anonymization import anonymize_medical_data
+from app.ai._clients import get_async_openai_client, get_gemini_service
+from app.ai.explanations import latest_explanations
+from app.ai.cache import chatbot_context_cache, chatbot_response_cache, chatbot_response_key, chatbot_sticky_models
+from app.ai.prompts import (
+    CHATBOT_FORBIDDEN_PHRASES_RE,
+    CHATBOT_REFUSAL_RESPONSES,
+    CHATBOT_UNSAFE_QUESTION_RE,
+    trim_chat_history,
+)
+from app.utils.anonymization import anonymize_values
 
 # Strict System Prompt
 MEDIBOT_SYSTEM_PROMPT = """You are MediBot, a helpful, extremely concise, and empathetic AI chatbot inside the MediGuide app.
@@ -29,26 +39,31 @@ STRICT SAFETY RULES (NON-NEGOTIABLE):
 
 CONTEXT:
 1. REPORT_METADATA: Type, date, lab.
-2. PARAMETERS: Values, units, flags, and ranges.
+2. PARAMETERS: A table of "columns" (name, value, unit, ref_range, flag, explanation) and "rows", one row per test in column order.
 3. EXPLANATIONS: Educational meanings.
 
 OUTPUT:
 An extremely short, warm, and direct chatbot response.
 """
 
+CONTEXT_PARAMETER_COLUMNS = ["name", "value", "unit", "ref_range", "flag", "explanation"]
+
+UNSAFE_REFUSAL = "I am an AI assistant and cannot provide medical diagnoses or prescribe medication. Please consult a qualified doctor for personal medical advice and treatment options."
+UNAVAILABLE_RESPONSE = "I'm currently unable to process your request. Please try again or consult your doctor for advice."
+ERROR_RESPONSE = "I apologize, but I'm unable to answer right now. Please consult your doctor for medical advice."
+
 class ChatbotService:
     # Sticky Model Tracking: {report_id: model_name}
-    # Once a report flips to OpenAI, it stays there for the duration of the server session
-    _sticky_models = {}
+    # Once a report flips to OpenAI it stays there until the entry expires (bounded LRU, shared by instances)
+    _sticky_models = chatbot_sticky_models
 
     def __init__(self):
-        from app.services.gemini_service import GeminiService
-        self.gemini = GeminiService()
+        self.gemini = get_gemini_service()
         
         # Initialize OpenAI as fallback
         self.openai_client = None
         if settings.OPENAI_API_KEY:
-            self.openai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
+            self.openai_client = get_async_openai_client(settings.OPENAI_API_KEY)
             self.openai_model = settings.OPENAI_MODEL
 
     async def generate_response(
@@ -66,93 +81,276 @@ class ChatbotService:
         """
         
         # 1. Pre-check for obviously unsafe keywords
-        unsafe_keywords = ["prescribe", "medication for me", "diagnose me", "do i have cancer", "am i dying"]
-        q_lower = question.lower()
-        if any(k in q_lower for k in unsafe_keywords):
-            return "I am an AI assistant and cannot provide medical diagnoses or prescribe medication. Please consult a qualified doctor for personal medical advice and treatment options."
-
-        # 2. Build and Anonymize Context
-        context_json = self._build_context_json(report_data, parameters, explanations)
-        anonymized_context = anonymize_medical_data(context_json)
-        
-        full_prompt = f"{MEDIBOT_SYSTEM_PROMPT}\n\nCONTEXT:\n{anonymized_context}"
+        if self.is_unsafe_question(question):
+            return UNSAFE_REFUSAL
+
+        # 2. Repeat questions about the same report version are answered from cache.
+        # Only stateless questions: an answer that depended on chat history is not reusable.
+        cache_key = None
+        if report_id and not chat_history:
+            cache_key = chatbot_response_key(report_id, report_data.get("updated_at"), question)
+            cached = chatbot_response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        # 3. Build and Anonymize Context
+        context = self._get_context(report_id, report_data, parameters, explanations)
         
-        # 3. Hybrid Execution Path
+        # 4. Hybrid Execution Path
+        response_text = await self._generate_hybrid(context, question, chat_history, report_id)
+        if cache_key and response_text and response_text not in (UNAVAILABLE_RESPONSE, ERROR_RESPONSE):
+            chatbot_response_cache.set(cache_key, response_text)
+        return response_text
+
+    async def _generate_hybrid(
+        self,
+        context: str,
+        question: str,
+        chat_history: Optional[List[Dict]],
+        report_id: Optional[str]
+    ) -> str:
+        """
+        Gemini first, sticky OpenAI fallback.
+        A Gemini call still running after LLM_CHAT_HEDGE_DELAY_SECONDS is hedged:
+        OpenAI is asked too and the first usable answer wins.
+        """
+        # STICKY SWITCH CHECK
+        if report_id and ChatbotService._sticky_models.get(report_id) == "openai":
+            print(f"[CHATBOT] Report {report_id} is flagged for STICKY OpenAI usage. Skipping Gemini.")
+            return await self._generate_openai_fallback(context, question, chat_history)
+
+        # TRY GEMINI 
+        print("[CHATBOT] Attempting Gemini call...")
+        gemini = asyncio.ensure_future(self._call_gemini(context, question))
+        fallback = None
         try:
-            # STICKY SWITCH CHECK
-            if report_id and ChatbotService._sticky_models.get(report_id) == "openai":
-                print(f"[CHATBOT] Report {report_id} is flagged for STICKY OpenAI usage. Skipping Gemini.")
-                return await self._generate_openai_fallback(full_prompt, question, chat_history)
-
-            # TRY GEMINI 
-            print("[CHATBOT] Attempting Gemini call...")
-            response_text, usage_metadata = self.gemini.chat_with_report_and_usage(full_prompt, question)
+            hedge_delay = settings.LLM_CHAT_HEDGE_DELAY_SECONDS
+            if self.openai_client and hedge_delay:
+                done, _ = await asyncio.wait({gemini}, timeout=hedge_delay)
+                if not done:
+                    print(f"[CHATBOT] Gemini still running after {hedge_delay}s. Hedging with OpenAI.")
+                    fallback = asyncio.ensure_future(self._generate_openai_fallback(context, question, chat_history))
+                    done, _ = await asyncio.wait({gemini, fallback}, return_when=asyncio.FIRST_COMPLETED)
+                    # OpenAI reports its own failures as canned replies; only a real answer beats Gemini
+                    if gemini not in done and fallback.result() not in (UNAVAILABLE_RESPONSE, ERROR_RESPONSE):
+                        gemini.cancel()
+                        return fallback.result()
+
+            response_text, usage_metadata = await gemini
             
             # Token Limit Tracking (Proactive Switch)
             if usage_metadata and hasattr(usage_metadata, 'total_token_count'):
                 if usage_metadata.total_token_count > settings.CHAT_TOKEN_LIMIT:
                     print(f"[CHATBOT] Gemini token limit reached. Switching report {report_id} to STICKY OpenAI.")
-                    if report_id: ChatbotService._sticky_models[report_id] = "openai"
-                    return await self._generate_openai_fallback(full_prompt, question, chat_history)
+                    if report_id: ChatbotService._sticky_models.set(report_id, "openai")
+                    return await (fallback or self._generate_openai_fallback(context, question, chat_history))
             
+            if fallback:
+                fallback.cancel()
             return response_text
 
         except Exception as e:
-            # Mark as Sticky OpenAI on error
-            print(f"[WARNING] Chatbot Gemini call failed: {e}. Switching report {report_id} to STICKY OpenAI.")
-            if report_id: ChatbotService._sticky_models[report_id] = "openai"
+            # Mark as Sticky OpenAI on error (including the hard deadline below)
+            print(f"[WARNING] Chatbot Gemini call failed: {e!r}. Switching report {report_id} to STICKY OpenAI.")
+            if report_id: ChatbotService._sticky_models.set(report_id, "openai")
             
-            # Immediate Fallback (No technical error message sent to user)
-            return await self._generate_openai_fallback(full_prompt, question, chat_history)
+            # Immediate Fallback (No technical error message sent to user); a hedge is already in flight
+            return await (fallback or self._generate_openai_fallback(context, question, chat_history))
+
+    async def _call_gemini(self, context: str, question: str) -> tuple:
+        """Blocking Gemini SDK call off the event loop, abandoned once the chat deadline passes"""
+        return await asyncio.wait_for(
+            asyncio.to_thread(
+                self.gemini.chat_with_report_and_usage,
+                context, question,
+                timeout=settings.LLM_CHAT_TIMEOUT_SECONDS,
+                system_instruction=MEDIBOT_SYSTEM_PROMPT
+            ),
+            settings.LLM_CHAT_TIMEOUT_SECONDS
+        )
 
-    async def _generate_openai_fallback(self, system_prompt: str, question: str, chat_history: Optional[List[Dict]]) -> str:
+    async def generate_response_stream(
+        self,
+        question: str,
+        report_data: Dict,
+        parameters: List[Dict],
+        explanations: List[Dict],
+        chat_history: Optional[List[Dict]] = None,
+        report_id: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Streaming variant of generate_response: yields text chunks as the model produces them.
+        Same hybrid routing; the stream is cut short with a refusal if a forbidden phrase appears.
+        """
+        if self.is_unsafe_question(question):
+            yield UNSAFE_REFUSAL
+            return
+
+        # Answers stored by generate_response are served whole. Streams are not written back:
+        # a stream that fails part-way would leave a truncated answer in the cache
+        if report_id and not chat_history:
+            cached = chatbot_response_cache.get(
+                chatbot_response_key(report_id, report_data.get("updated_at"), question)
+            )
+            if cached is not None:
+                yield cached
+                return
+
+        context = self._get_context(report_id, report_data, parameters, explanations)
+
+        if report_id and ChatbotService._sticky_models.get(report_id) == "openai":
+            print(f"[CHATBOT] Report {report_id} is flagged for STICKY OpenAI usage. Skipping Gemini.")
+            chunks = self._stream_openai_fallback(context, question, chat_history)
+        else:
+            chunks = self._stream_gemini_with_fallback(context, question, chat_history, report_id)
+
+        buffer = ""
+        async for chunk in chunks:
+            buffer += chunk
+            if CHATBOT_FORBIDDEN_PHRASES_RE.search(buffer):
+                await chunks.aclose()
+                yield "\n\n" + random.choice(CHATBOT_REFUSAL_RESPONSES)
+                return
+            yield chunk
+
+    async def _stream_gemini_with_fallback(
+        self,
+        context: str,
+        question: str,
+        chat_history: Optional[List[Dict]],
+        report_id: Optional[str]
+    ) -> AsyncIterator[str]:
+        """Stream from Gemini; switch to OpenAI if Gemini fails before producing output"""
+        started = False
+        try:
+            print("[CHATBOT] Attempting Gemini stream...")
+            chunks = self.gemini.chat_with_report_stream(
+                context, question,
+                timeout=settings.LLM_CHAT_TIMEOUT_SECONDS,
+                system_instruction=MEDIBOT_SYSTEM_PROMPT
+            )
+            # The Gemini SDK iterator blocks, so pull each chunk off the event loop
+            while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+                started = True
+                yield chunk
+            return
+        except Exception as e:
+            print(f"[WARNING] Chatbot Gemini stream failed: {e}. Switching report {report_id} to STICKY OpenAI.")
+            if report_id: ChatbotService._sticky_models.set(report_id, "openai")
+            if started:
+                return
+
+        async for chunk in self._stream_openai_fallback(context, question, chat_history):
+            yield chunk
+
+    async def _stream_openai_fallback(self, context: str, question: str, chat_history: Optional[List[Dict]]) -> AsyncIterator[str]:
+        """Streaming fallback to OpenAI"""
+        if not self.openai_client:
+            yield UNAVAILABLE_RESPONSE
+            return
+
+        started = False
+        try:
+            print("[CHATBOT] Streaming OpenAI Chat Completion...")
+            stream = await self.openai_client.chat.completions.create(
+                model=self.openai_model,
+                messages=self._build_openai_messages(context, question, chat_history),
+                temperature=0.7,
+                max_tokens=300,
+                stream=True,
+                timeout=settings.LLM_CHAT_TIMEOUT_SECONDS
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    started = True
+                    yield chunk.choices[0].delta.content
+        except Exception as oe:
+            print(f"[ERROR] OpenAI streaming failed: {oe}")
+            if not started:
+                yield ERROR_RESPONSE
+
+    async def _generate_openai_fallback(self, context: str, question: str, chat_history: Optional[List[Dict]]) -> str:
         """Fallback to OpenAI for high availability"""
         if not self.openai_client:
-            return "I'm currently unable to process your request. Please try again or consult your doctor for advice."
+            return UNAVAILABLE_RESPONSE
             
-        messages = [
-            {"role": "system", "content": system_prompt}
-        ]
-        
-        # Add history if provided
-        if chat_history:
-            for msg in chat_history[-5:]: # Last 5 for context
-                messages.append({
-                    "role": "user" if msg.get("role") == "user" else "assistant",
-                    "content": msg.get("content", "")
-                })
-        
-        messages.append({"role": "user", "content": question})
+        messages = self._build_openai_messages(context, question, chat_history)
         
         try:
             print("[CHATBOT] Calling OpenAI Chat Completion...")
-            response = self.openai_client.chat.completions.create(
+            response = await self.openai_client.chat.completions.create(
                 model=self.openai_model,
                 messages=messages,
                 temperature=0.7,
-                max_tokens=300
+                max_tokens=300,
+                timeout=settings.LLM_CHAT_TIMEOUT_SECONDS
             )
             return response.choices[0].message.content
         except Exception as oe:
             print(f"[ERROR] OpenAI completion failed: {oe}")
-            return "I apologize, but I'm unable to answer right now. Please consult your doctor for medical advice."
+            return ERROR_RESPONSE
+
+    def is_unsafe_question(self, question: str) -> bool:
+        """Pre-check for obviously unsafe keywords"""
+        return CHATBOT_UNSAFE_QUESTION_RE.search(question) is not None
+
+    def _get_context(self, report_id: Optional[str], report: Dict, params: List[Dict], explanations: List[Dict]) -> str:
+        """Anonymized report context, built once per report version and reused across chat turns"""
+        if not report_id:
+            return self._build_context(report, params, explanations)
 
-    def _build_context_json(self, report: Dict, params: List[Dict], explanations: List[Dict]) -> str:
+        key = (report_id, report.get("updated_at"), len(params), len(explanations))
+        context = chatbot_context_cache.get(key)
+        if context is None:
+            context = self._build_context(report, params, explanations)
+            chatbot_context_cache.set(key, context)
+        return context
+
+    def _build_context(self, report: Dict, params: List[Dict], explanations: List[Dict]) -> str:
+        """Anonymized report context"""
+        # Scrub field values before serialising, so keys and JSON punctuation are never scanned
+        context = anonymize_values(self._build_context_data(report, params, explanations))
+        # Compact output: indentation would only add tokens to every chat turn
+        return orjson.dumps(context, default=str).decode()
+
+    def _build_openai_messages(self, context: str, question: str, chat_history: Optional[List[Dict]]) -> List[Dict]:
+        """
+        Chat messages for the OpenAI fallback.
+        The system message is identical for every report so OpenAI's prefix cache can reuse it;
+        the per-report context follows as its own message.
+        """
+        messages = [
+            {"role": "system", "content": MEDIBOT_SYSTEM_PROMPT},
+            {"role": "user", "content": f"CONTEXT:\n{context}"}
+        ]
+        
+        # Add recent history, bounded by token budget rather than message count
+        for msg in trim_chat_history(chat_history, settings.CHAT_HISTORY_TOKEN_BUDGET):
+            messages.append({
+                "role": "user" if msg.get("role") == "user" else "assistant",
+                "content": msg.get("content", "")
+            })
+        
+        messages.append({"role": "user", "content": question})
+        return messages
+
+    def _build_context_data(self, report: Dict, params: List[Dict], explanations: List[Dict]) -> Dict:
         """Helper to format data for the LLM"""
-        clean_params = []
+        # Index explanations once; newest per parameter, the same rule as the report views
+        expl_by_pid = latest_explanations(explanations)
+
+        # Column-oriented so the field names are sent once rather than once per parameter
+        rows = []
         for p in params:
-            item = {
-                "name": p.get("name"),
-                "value": p.get("value"),
-                "unit": p.get("unit"),
-                "ref_range": p.get("range") or p.get("normal_range"),
-                "flag": p.get("flag"),
-            }
-            expl = next((e for e in explanations if e.get("parameter_id") == p.get("id")), None)
-            if expl:
-                item["explanation_meaning"] = expl.get("meaning")
-            
-            clean_params.append(item)
+            expl = expl_by_pid.get(p.get("id"))
+            rows.append([
+                p.get("name"),
+                p.get("value"),
+                p.get("unit"),
+                p.get("range") or p.get("normal_range"),
+                p.get("flag"),
+                expl.get("meaning") if expl else None,
+            ])
             
         context = {
             "report_metadata": {
@@ -162,7 +360,10 @@ class ChatbotService:
                 "patient_name": report.get("patient_name", "Unknown"), # We anonymize this later
                 "overall_flag": report.get("flag_level")
             },
-            "parameters": clean_params
+            "parameters": {
+                "columns": CONTEXT_PARAMETER_COLUMNS,
+                "rows": rows
+            }
         }
         
-        return json.dumps(context, indent=2)
+        return context
@@ -5,61 +5,59 @@ Manages family member connections and shared report access
 import uuid
 from datetime import datetime
 from typing import List, Optional, Dict
-from app.supabase.client import get_supabase
-from app.services.premium_service import PremiumService
+from postgrest.exceptions import APIError
+from app.core.postgrest import get_async_postgrest
+from app.services.premium_service import PremiumService, premium_status_cache
+from app.core.config import settings
+from app.utils.cache import TTLCache
+
+# Member lists per user for the polled /family/members endpoint; dropped on any connection change
+family_members_cache = TTLCache(maxsize=10_000, ttl=settings.FAMILY_MEMBERS_CACHE_TTL_SECONDS)
+
+
+def _invalidate_members(*user_ids: str):
+    """Forget cached member lists (and family counts in premium status) for both sides of a connection"""
+    for uid in user_ids:
+        family_members_cache.pop(uid)
+        premium_status_cache.pop(uid)
 
 
 class FamilyService:
     """Service for managing family connections"""
     
     def __init__(self):
-        self.supabase = get_supabase()
         self.premium_service = PremiumService()
-        from app.core.security import get_service_supabase_client
-        self.admin_supabase = get_service_supabase_client()
+
+    # Looked up per call: the service is shared for the process, while the pools are rebuilt per lifespan
+    @property
+    def supabase(self):
+        return get_async_postgrest()
+
+    @property
+    def admin_supabase(self):
+        return get_async_postgrest(True)
     
     async def list_family_members(self, user_id: str) -> List[Dict]:
         """List all family connections (connected AND pending) for a user"""
-        # 1. Get connections
-        response = self.admin_supabase.table("family_connections").select(
+        cached = family_members_cache.get(user_id)
+        if cached is not None:
+            return cached
+        results = await self._load_family_members(user_id)
+        family_members_cache.set(user_id, results)
+        return results
+
+    async def _load_family_members(self, user_id: str) -> List[Dict]:
+        """Query connections with both profiles resolved (family_connections_enriched view)"""
+        # 1. Get connections; profile names are coalesced in SQL (migration 011)
+        response = await self.admin_supabase.table("family_connections_enriched").select(
             "*"
         ).or_(
             f"user_id.eq.{user_id},connected_user_id.eq.{user_id}"
         ).in_("status", ["connected", "pending_sent"]).execute()
         
-        data = response.data or []
-        
-        if not data:
-            return []
-
-        # 2. Collect Profile IDs to fetch
-        profile_ids = set()
-        for conn in data:
-            profile_ids.add(conn["user_id"])
-            profile_ids.add(conn["connected_user_id"])
-        
-        # 3. Fetch Profiles manually (Use Admin Client to bypass RLS)
-        profiles_map = {}
-        if profile_ids:
-             # profiles table seems to lack full_name/first_name in this env. Using phone_number as fallback if needed.
-             # We try multiple fields for name: full_name, profile_name, first_name
-             p_res = self.admin_supabase.table("profiles").select("*").in_("id", list(profile_ids)).execute()
-             if p_res.data:
-                 for p in p_res.data:
-                     # Try to derive a usable name
-                     name_candidates = [
-                         p.get("full_name"),
-                         p.get("profile_name"),
-                         p.get("first_name"),
-                         p.get("phone_number")
-                     ]
-                     final_name = next((n for n in name_candidates if n), "User")
-                     p["computed_name"] = final_name
-                     profiles_map[p["id"]] = p
-
-        # 4. Post-process
+        # 2. Post-process
         results = []
-        for conn in data:
+        for conn in response.data or []:
             is_sender = conn["user_id"] == user_id
             status = conn["status"]
             
@@ -75,16 +73,22 @@ class FamilyService:
                 connection_status = "pending"
 
             # Determine target ("other person")
-            target_id = conn["connected_user_id"] if is_sender else conn["user_id"]
-            target_profile = profiles_map.get(target_id) or {}
+            if is_sender:
+                target_id = conn["connected_user_id"]
+                profile_name = conn.get("receiver_profile_name")
+                identifier = conn.get("receiver_identifier")
+            else:
+                target_id = conn["user_id"]
+                profile_name = conn.get("sender_profile_name")
+                identifier = conn.get("sender_identifier")
             
             # Resolve Display Name (Alias)
             # If I am sender, I see sender_display_name
             # If I am receiver, I see receiver_display_name
             alias = conn.get("sender_display_name") if is_sender else conn.get("receiver_display_name")
             
-            profile_name = target_profile.get("computed_name", "Unknown")
-            identifier = target_profile.get("phone_number") or target_profile.get("email") or "Hidden"
+            # No profile row at all leaves the name NULL
+            profile_name = profile_name or "Unknown"
             
             # Final effective display name
             display_name = alias or profile_name
@@ -94,7 +98,7 @@ class FamilyService:
                 "user_id": target_id,
                 "display_name": display_name,
                 "profile_name": profile_name,
-                "phone": identifier,
+                "phone": identifier or "Hidden",
                 "status": status,
                 "connection_status": connection_status,
                 "created_at": conn["created_at"]
@@ -119,7 +123,7 @@ class FamilyService:
             raise ValueError(error_msg)
         
         # Get Sender Profile Name (to populate sender_display_name)
-        sender_profile = self.admin_supabase.table("profiles").select("*").eq("id", user_id).single().execute()
+        sender_profile = await self.admin_supabase.table("profiles").select("*").eq("id", user_id).single().execute()
         sender_name = None
         if sender_profile.data:
             p = sender_profile.data
@@ -130,38 +134,20 @@ class FamilyService:
         
         if email:
             try:
-                 # Instead of RPC, fetch users directly via Admin API (which we know works)
-                 from app.core.security import get_service_supabase_client
-                 admin_client = get_service_supabase_client()
-                 
-                 # Fetch users (default page size is usually 50, let's try to get more if needed loop)
-                 # Ideally, we should iterate pages, but for now fetching a reasonable list
-                 # Note: in Python client, list_users() might not support page params easily in all versions
-                 # But let's try the standard method we verified.
-                 auth_users_res = admin_client.auth.admin.list_users()
-                 
-                 auth_list = []
-                 if isinstance(auth_users_res, list):
-                     auth_list = auth_users_res
-                 elif hasattr(auth_users_res, "users"):
-                     auth_list = auth_users_res.users
-                 elif isinstance(auth_users_res, dict) and "users" in auth_users_res:
-                     auth_list = auth_users_res["users"]
-
-                 # Find user by email (case-insensitive)
-                 target_email_lower = email.lower().strip()
-                 for u in auth_list:
-                     u_email = getattr(u, "email", "") or (u.get("email") if isinstance(u, dict) else "")
-                     if u_email and u_email.lower().strip() == target_email_lower:
-                         target_user_id = getattr(u, "id", None) or (u.get("id") if isinstance(u, dict) else None)
-                         break
+                 # Point lookup on auth.users via the get_user_id_by_email RPC (migration 005).
+                 # Supabase Auth stores emails lowercased, so normalising here keeps it an exact, indexed match
+                 res = await self.admin_supabase.rpc(
+                     "get_user_id_by_email", {"email": email.strip().lower()}
+                 ).execute()
+                 if res.data:
+                     target_user_id = res.data[0]["id"]
                  
             except Exception as e:
                  print(f"Error looking up email: {e}")
                  pass
         
         if not target_user_id and phone_number:
-            res = self.admin_supabase.table("profiles").select("id").eq("phone_number", phone_number).execute()
+            res = await self.admin_supabase.table("profiles").select("id").eq("phone_number", phone_number).execute()
             if res.data:
                 target_user_id = res.data[0]["id"]
                 
@@ -171,10 +157,12 @@ class FamilyService:
         if target_user_id == user_id:
             raise ValueError("Cannot invite yourself")
 
-        # Check existing connection
-        existing = self.admin_supabase.table("family_connections").select("*").or_(
-            f"and(user_id.eq.{user_id},connected_user_id.eq.{target_user_id}),and(user_id.eq.{target_user_id},connected_user_id.eq.{user_id})"
-        ).execute()
+        # Check existing connection in either direction: one probe of the canonical pair index (migration 012).
+        # Canonical lowercase UUID text sorts the same way Postgres orders the uuids
+        pair_low, pair_high = sorted((str(uuid.UUID(user_id)), str(uuid.UUID(target_user_id))))
+        existing = await self.admin_supabase.table("family_connections").select("id").eq(
+            "pair_low", pair_low
+        ).eq("pair_high", pair_high).limit(1).execute()
         
         if existing.data:
             raise ValueError("Connection already exists or is pending")
@@ -196,7 +184,14 @@ class FamilyService:
             "receiver_display_name": None
         }
         
-        self.admin_supabase.table("family_connections").insert(connection_data).execute()
+        try:
+            await self.admin_supabase.table("family_connections").insert(connection_data).execute()
+        except APIError as e:
+            # A concurrent invite for the same pair won the race
+            if e.code == "23505":
+                raise ValueError("Connection already exists or is pending")
+            raise
+        _invalidate_members(user_id, target_user_id)
         
         return connection_id
     
@@ -209,7 +204,7 @@ class FamilyService:
         """Accept a family connection request"""
         # I am the 'connected_user_id' (recipient)
         
-        response = self.admin_supabase.table("family_connections").select("*").eq(
+        response = await self.admin_supabase.table("family_connections").select("*").eq(
             "id", connection_id
         ).eq("connected_user_id", user_id).eq("status", "pending_sent").single().execute()
         
@@ -225,7 +220,8 @@ class FamilyService:
         if display_name:
             update_data["receiver_display_name"] = display_name
 
-        self.admin_supabase.table("family_connections").update(update_data).eq("id", connection_id).execute()
+        await self.admin_supabase.table("family_connections").update(update_data).eq("id", connection_id).execute()
+        _invalidate_members(response.data["user_id"], user_id)
         
         return True
 
@@ -237,7 +233,7 @@ class FamilyService:
     ) -> bool:
         """Rename a family connection (set alias)"""
         # 1. Fetch connection to see if I am sender or receiver
-        response = self.admin_supabase.table("family_connections").select("*").eq(
+        response = await self.admin_supabase.table("family_connections").select("*").eq(
             "id", connection_id
         ).or_(
             f"user_id.eq.{user_id},connected_user_id.eq.{user_id}"
@@ -252,17 +248,18 @@ class FamilyService:
         # 2. Update the appropriate column
         field = "sender_display_name" if is_sender else "receiver_display_name"
         
-        self.admin_supabase.table("family_connections").update({
+        await self.admin_supabase.table("family_connections").update({
             field: new_display_name,
             "updated_at": datetime.now().isoformat()
         }).eq("id", connection_id).execute()
+        _invalidate_members(conn["user_id"], conn["connected_user_id"])
         
         return True
     
     async def remove_connection(self, connection_id: str, user_id: str) -> bool:
         """Remove a family connection"""
         # Verify ownership
-        response = self.supabase.table("family_connections").select("*").eq(
+        response = await self.supabase.table("family_connections").select("*").eq(
             "id", connection_id
         ).or_(
             f"user_id.eq.{user_id},connected_user_id.eq.{user_id}"
@@ -272,6 +269,7 @@ class FamilyService:
             return False
         
         # Delete connection
-        self.supabase.table("family_connections").delete().eq("id", connection_id).execute()
+        await self.supabase.table("family_connections").delete().eq("id", connection_id).execute()
+        _invalidate_members(response.data["user_id"], response.data["connected_user_id"])
         
         return True
@@ -1,11 +1,21 @@
 import os
-import json
+import orjson
 import google.generativeai as genai
 from PIL import Image
-from openai import OpenAI
 import io
 import time
+from typing import Optional
+from google.api_core import exceptions as google_exceptions
 from app.core.config import settings
+from app.ai._clients import get_openai_client
+
+# Gemini failures worth a fresh attempt
+GEMINI_TRANSIENT_ERRORS = (
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.ResourceExhausted,
+)
 
 class GeminiService:
     def __init__(self):
@@ -14,24 +24,28 @@ class GeminiService:
             raise ValueError("GOOGLE_API_KEY environment variable not set")
         genai.configure(api_key=api_key)
         # Using 2.5 Flash as per user request.
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
+        self.model_name = 'gemini-2.5-flash'
+        self.model = genai.GenerativeModel(self.model_name)
+        # Models bound to a static system instruction, one per instruction text
+        self._instructed_models = {}
         
         # Initialize OpenAI for fallback
         self.openai_client = None
         if settings.OPENAI_API_KEY:
-            self.openai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
+            self.openai_client = get_openai_client(settings.OPENAI_API_KEY)
             self.openai_model = "gpt-4o" # Vision requires gpt-4o
 
-    def generate_json(self, prompt: str) -> dict:
+    def generate_json(self, prompt: str, timeout: Optional[float] = None, system_instruction: Optional[str] = None) -> dict:
         """
         Generates a JSON response from the given prompt.
         """
         try:
             # Force JSON structure in prompt if not present
-            if "JSON" not in prompt:
+            if "JSON" not in prompt and "JSON" not in (system_instruction or ""):
                 prompt += "\n\nReturn strict JSON."
                 
-            response = self.model.generate_content(prompt)
+            model = self._model_for(system_instruction)
+            response = model.generate_content(prompt, request_options=self._request_options(timeout))
             text = response.text.strip()
             
             # Clean up markdown code blocks
@@ -42,11 +56,20 @@ class GeminiService:
             if text.endswith("```"):
                 text = text[:-3]
                 
-            return json.loads(text.strip())
+            return orjson.loads(text.strip())
         except Exception as e:
             print(f"[ERROR] Gemini JSON generation failed: {e}")
             raise e
 
+    def generate_json_stream(self, prompt: str, timeout: Optional[float] = None, system_instruction: Optional[str] = None):
+        """
+        Streams the raw text of a JSON response as it is generated.
+        """
+        model = self._model_for(system_instruction)
+        for chunk in model.generate_content(prompt, stream=True, request_options=self._request_options(timeout)):
+            if chunk.text:
+                yield chunk.text
+
     def generate_text(self, prompt: str) -> str:
         """
         Generates a plain text response.
@@ -145,7 +168,7 @@ class GeminiService:
             if text.endswith("```"):
                 text = text[:-3]
             
-            return json.loads(text.strip())
+            return orjson.loads(text.strip())
 
         except Exception as e:
             print(f"[WARNING] Gemini analysis failed: {e}. Attempting OpenAI fallback...")
@@ -177,7 +200,7 @@ class GeminiService:
                 response_format={"type": "json_object"}
             )
             text = response.choices[0].message.content
-            return json.loads(text)
+            return orjson.loads(text)
         except Exception as e:
             print(f"[ERROR] OpenAI Analysis failed: {e}")
             raise e
@@ -192,12 +215,64 @@ class GeminiService:
         except Exception as e:
             raise e
 
-    def chat_with_report_and_usage(self, report_context: str, user_question: str) -> tuple:
+    def chat_with_report_and_usage(
+        self,
+        report_context: str,
+        user_question: str,
+        timeout: Optional[float] = None,
+        system_instruction: Optional[str] = None
+    ) -> tuple:
         """
         Answers user questions and returns both text and usage metadata for token tracking.
         """
         try:
-            prompt = f"""
+            prompt = self._chat_prompt(report_context, user_question)
+            
+            model = self._model_for(system_instruction)
+            response = model.generate_content(prompt, request_options=self._request_options(timeout))
+            return response.text, response.usage_metadata
+            
+        except Exception as e:
+            # Check for 429 specifically if possible, or just re-raise for service layer to catch
+            print(f"Gemini Chat Error: {e}")
+            raise e
+
+    def chat_with_report_stream(
+        self,
+        report_context: str,
+        user_question: str,
+        timeout: Optional[float] = None,
+        system_instruction: Optional[str] = None
+    ):
+        """
+        Streams the answer to a user question as text chunks.
+        """
+        prompt = self._chat_prompt(report_context, user_question)
+        model = self._model_for(system_instruction)
+        for chunk in model.generate_content(prompt, stream=True, request_options=self._request_options(timeout)):
+            if chunk.text:
+                yield chunk.text
+
+    def _model_for(self, system_instruction: Optional[str]):
+        """Model carrying a static system instruction, so the prefix stays identical across calls"""
+        if not system_instruction:
+            return self.model
+        model = self._instructed_models.get(system_instruction)
+        if model is None:
+            model = genai.GenerativeModel(self.model_name, system_instruction=system_instruction)
+            self._instructed_models[system_instruction] = model
+        return model
+
+    def _request_options(self, timeout: Optional[float]) -> Optional[dict]:
+        """Per-call deadline for the Gemini API"""
+        return {"timeout": timeout} if timeout else None
+
+    def _chat_prompt(self, report_context: str, user_question: str) -> str:
+        """
+        Prompt shared by the blocking and streaming chat calls.
+        Report context comes before the question so repeat turns on a report share a cacheable prefix.
+        """
+        return f"""
             Context: The user has uploaded a medical report with the following details:
             {report_context}
             
@@ -207,11 +282,3 @@ class GeminiService:
             If the answer is not in the report, use general medical knowledge but clarify that it's general advice.
             Keep the answer concise and easy to understand.
             """
-            
-            response = self.model.generate_content(prompt)
-            return response.text, response.usage_metadata
-            
-        except Exception as e:
-            # Check for 429 specifically if possible, or just re-raise for service layer to catch
-            print(f"Gemini Chat Error: {e}")
-            raise e
@@ -0,0 +1,100 @@
+"""
+In-process job queue for report processing.
+A fixed pool of worker tasks drains a bounded queue, so a burst of uploads
+cannot run unbounded OCR/LLM pipelines concurrently with request handlers.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    """Bounded asyncio queue served by a fixed number of workers"""
+
+    def __init__(self, workers: int, max_size: int):
+        self.workers = workers
+        self.max_size = max_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # Job each worker is running, by worker index
+        self._active: Dict[int, Tuple] = {}
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        """Spawn the worker tasks on the running event loop"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self, timeout: float = settings.REPORT_QUEUE_DRAIN_SECONDS):
+        """
+        Let the workers finish queued jobs for up to timeout seconds, then cancel them.
+        Jobs still running or queued at that point are handed to their on_abandon callback.
+        """
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Job queue not drained within %.1fs; abandoning remaining jobs", timeout)
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        abandoned = list(self._active.values())
+        while not self._queue.empty():
+            abandoned.append(self._queue.get_nowait())
+        self._tasks = []
+        self._queue = None
+        self._active = {}
+
+        for func, args, kwargs, on_abandon in abandoned:
+            if on_abandon is None:
+                continue
+            try:
+                await on_abandon(*args, **kwargs)
+            except Exception as e:
+                logger.error("Abandon handler for %s failed: %s", getattr(func, "__name__", func), e)
+
+    async def enqueue(
+        self,
+        func: Callable[..., Awaitable[Any]],
+        *args: Any,
+        on_abandon: Optional[Callable[..., Awaitable[Any]]] = None,
+        **kwargs: Any
+    ):
+        """
+        Queue a coroutine function call; waits for a free slot when the queue is full.
+        on_abandon is awaited with the same arguments if shutdown stops the job before it finishes.
+        """
+        await self._queue.put((func, args, kwargs, on_abandon))
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self._queue.get()
+            func, args, kwargs, _ = job
+            self._active[index] = job
+            try:
+                await func(*args, **kwargs)
+            except asyncio.CancelledError:
+                # Stays in _active so stop() can hand it to on_abandon
+                raise
+            except Exception as e:
+                logger.error("Job %s failed in worker %d: %s", getattr(func, "__name__", func), index, e)
+            del self._active[index]
+            self._queue.task_done()
+
+
+report_job_queue = JobQueue(
+    workers=settings.REPORT_WORKER_CONCURRENCY,
+    max_size=settings.REPORT_QUEUE_MAX_SIZE,
+)
@@ -2,10 +2,19 @@
 Premium subscription service
 Handles subscription checks and usage tracking
 """
-from typing import Optional
+import asyncio
+from typing import Dict, Optional
 from datetime import datetime, timedelta
 from app.supabase.client import get_supabase
+from app.core.postgrest import get_async_postgrest
 from app.core.config import settings
+from app.utils.cache import TTLCache
+
+# (is_premium, usage stats) per user for the polled /premium/status endpoint
+premium_status_cache = TTLCache(maxsize=10_000, ttl=settings.PREMIUM_STATUS_CACHE_TTL_SECONDS)
+# Active-subscription flag per user, checked by require_premium on every premium request
+subscription_cache = TTLCache(maxsize=10_000, ttl=settings.PREMIUM_STATUS_CACHE_TTL_SECONDS)
+_subscription_lookups: Dict[str, asyncio.Future] = {}
 
 
 class PremiumService:
@@ -24,29 +33,50 @@ class PremiumService:
         Returns:
             True if user has premium, False otherwise
         """
+        cached = subscription_cache.get(user_id)
+        if cached is not None:
+            return cached
+
+        # Concurrent requests for the same user share one lookup
+        task = _subscription_lookups.get(user_id)
+        if task is None:
+            task = asyncio.ensure_future(self._query_subscription(user_id))
+            _subscription_lookups[user_id] = task
+            task.add_done_callback(lambda _: _subscription_lookups.pop(user_id, None))
         try:
-            # Query subscriptions table
-            response = self.supabase.table("subscriptions").select("*").eq(
-                "user_id", user_id
-            ).eq("status", "active").limit(1).execute()
-            
-            if response.data and len(response.data) > 0:
-                subscription = response.data[0]
-                expires_at = subscription.get("expires_at")
-                
-                # Check if subscription hasn't expired
-                if expires_at:
-                    expires = datetime.fromisoformat(expires_at.replace('Z', '+00:00'))
-                    if expires < datetime.now(expires.tzinfo):
-                        return False
-                
-                return True
-            
-            return False
-        
+            is_premium, ttl = await asyncio.shield(task)
         except Exception:
             # If subscription table doesn't exist or query fails, default to free
             return False
+
+        subscription_cache.set(user_id, is_premium, ttl=ttl)
+        return is_premium
+
+    async def _query_subscription(self, user_id: str) -> tuple[bool, float]:
+        """Active-subscription flag and how long it may be cached"""
+        ttl = subscription_cache.ttl
+        # Awaited on the async client: a blocking call would finish before any concurrent
+        # caller could find this lookup in _subscription_lookups, so nothing would coalesce
+        response = await get_async_postgrest().table("subscriptions").select("expires_at").eq(
+            "user_id", user_id
+        ).eq("status", "active").limit(1).execute()
+        
+        if response.data and len(response.data) > 0:
+            subscription = response.data[0]
+            expires_at = subscription.get("expires_at")
+            
+            # Check if subscription hasn't expired
+            if expires_at:
+                expires = datetime.fromisoformat(expires_at.replace('Z', '+00:00'))
+                remaining = (expires - datetime.now(expires.tzinfo)).total_seconds()
+                if remaining <= 0:
+                    return False, ttl
+                # Don't keep reporting premium past the expiry
+                ttl = min(ttl, remaining)
+            
+            return True, ttl
+        
+        return False, ttl
     
     async def get_usage_stats(self, user_id: str) -> dict:
         """
@@ -101,6 +131,15 @@ class PremiumService:
                 "family_members_limit": None if is_premium else settings.FREE_TIER_FAMILY_MEMBERS,
             }
     
+    async def get_status(self, user_id: str) -> tuple[bool, dict]:
+        """Subscription flag and usage stats, cached briefly per user"""
+        cached = premium_status_cache.get(user_id)
+        if cached is not None:
+            return cached
+        status = (await self.check_subscription(user_id), await self.get_usage_stats(user_id))
+        premium_status_cache.set(user_id, status)
+        return status
+
     async def check_report_limit(self, user_id: str) -> tuple[bool, Optional[str]]:
         """
         Check if user can create a new report (free tier limit)
@@ -2,26 +2,65 @@
 Report service - Core service for managing medical reports
 Orchestrates OCR, AI, and data storage
 """
+import base64
+import logging
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 import asyncio
-from typing import List, Optional, Dict, Any
+from functools import cached_property
+from typing import List, Optional, Dict, Any, Tuple, AsyncIterator
+import orjson
 
 from fastapi import BackgroundTasks, Request
+from postgrest.exceptions import APIError
 
-from app.core.security import get_authed_supabase_client
-from app.services.premium_service import PremiumService
+from app.services.premium_service import PremiumService, premium_status_cache
 from app.services.safety_service import SafetyService
 from app.utils.ocr import OCRService
-from app.utils.ocr import OCRService
-from app.ai.explanations import ExplanationService
-from app.ai.synthesis import SynthesisService
+from app.ai.explanations import ExplanationService, latest_explanations
+from app.ai.synthesis import SYNTHESIS_FIELDS, SynthesisService
+from app.ai._clients import get_gemini_service
+from app.services.job_queue import report_job_queue
 from app.schemas.report import ReportResponse, TestParameterResponse
 from app.core.config import settings
 from app.core.security import get_authed_supabase_client, get_service_supabase_client
+from app.core.postgrest import get_async_postgrest, get_authed_async_postgrest
 from app.supabase.storage_service import upload_to_supabase_storage
 
 
+logger = logging.getLogger(__name__)
+
+# PostgREST max-rows (Supabase default); "estimated" counts above this come from the planner
+EXACT_COUNT_MAX_ROWS = 1000
+
+# time_range query values accepted by list_reports
+TIME_RANGE_DAYS = {"7d": 7, "30d": 30, "90d": 90}
+
+
+def encode_report_cursor(row: Dict[str, Any]) -> str:
+    """Opaque keyset cursor for the row a page ended on"""
+    return base64.urlsafe_b64encode(orjson.dumps([row["created_at"], row["id"]])).decode()
+
+
+def decode_report_cursor(cursor: str) -> Tuple[str, str]:
+    """(created_at, id) from a cursor made by encode_report_cursor"""
+    try:
+        created_at, report_id = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(created_at), str(uuid.UUID(str(report_id)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def after_report_cursor(query, after: Tuple[str, str]):
+    """
+    Rows strictly after (created_at, id) in newest-first order.
+    The lte on created_at alone lets the (…, created_at DESC, id DESC) index bound the scan.
+    """
+    created_at, last_id = after
+    return query.lte("created_at", created_at).or_(
+        f'created_at.lt."{created_at}",id.lt.{last_id}'
+    )
+
 
 class ReportService:
     """Service for managing medical reports"""
@@ -31,12 +70,31 @@ class ReportService:
         self.db = get_authed_supabase_client(request)
         # ✅ SERVICE ROLE CLIENT FOR STORAGE (BYPASSES RLS)
         self.storage_client = get_service_supabase_client()
-        self.premium_service = PremiumService()
-        self.safety_service = SafetyService()
-        self.ocr_service = OCRService()
-        self.ocr_service = OCRService()
-        self.explanation_service = ExplanationService()
-        self.synthesis_service = SynthesisService()
+        # Async counterparts for read paths, so lookups don't block the event loop
+        self.async_db = get_authed_async_postgrest(request)
+        self.async_storage = get_async_postgrest(True)
+
+    # Helpers used by the upload/processing paths are built on first use,
+    # so read-only requests only pay for the database clients above
+    @cached_property
+    def premium_service(self) -> PremiumService:
+        return PremiumService()
+
+    @cached_property
+    def safety_service(self) -> SafetyService:
+        return SafetyService()
+
+    @cached_property
+    def ocr_service(self) -> OCRService:
+        return OCRService()
+
+    @cached_property
+    def explanation_service(self) -> ExplanationService:
+        return ExplanationService()
+
+    @cached_property
+    def synthesis_service(self) -> SynthesisService:
+        return SynthesisService(db=self.storage_client)
 
     async def verify_family_access(self, requester_id: str, target_id: str) -> bool:
         """Verify if requester has family connection with target"""
@@ -44,7 +102,7 @@ class ReportService:
             return True
             
         # Check for confirmed connection in either direction
-        response = self.storage_client.table("family_connections").select("id").or_(
+        response = await self.async_storage.table("family_connections").select("id").or_(
             f"and(user_id.eq.{requester_id},connected_user_id.eq.{target_id},status.eq.connected),"
             f"and(user_id.eq.{target_id},connected_user_id.eq.{requester_id},status.eq.connected)"
         ).execute()
@@ -62,10 +120,9 @@ class ReportService:
         
         # --- SEQUENTIAL VALIDATION PIPELINE ---
         
-        from app.services.gemini_service import GeminiService
         from app.utils.image_processing import check_blur, enhance_image
         
-        gemini = GeminiService()
+        gemini = get_gemini_service()
 
         # 1. AI Medical Check
         print("[VALIDATION] Checking if image is a medical report...")
@@ -121,9 +178,20 @@ class ReportService:
 
         if not response.data:
             raise RuntimeError("Failed to insert report record")
+        # Monthly usage in /premium/status just changed
+        premium_status_cache.pop(user_id)
 
         # Background processing with FINAL validated image
-        if background_tasks:
+        if report_job_queue.running:
+            # Bounded worker pool; the upload request only waits if the queue is full
+            await report_job_queue.enqueue(
+                self._process_report,
+                report_id,
+                user_id,
+                final_image_data,
+                on_abandon=self._mark_interrupted,
+            )
+        elif background_tasks:
             background_tasks.add_task(
                 self._process_report,
                 report_id,
@@ -273,13 +341,13 @@ class ReportService:
             await self._update_progress(report_id, 10)
             
             # Using Gemini for authentic analysis
-            from app.services.gemini_service import GeminiService
-            gemini_service = GeminiService()
+            gemini_service = get_gemini_service()
             
             # 30% - Sending to Gemini
             await self._update_progress(report_id, 30)
             
-            extracted_data = gemini_service.analyze_medical_report(image_data)
+            # Blocking SDK call; keep the event loop free for request handlers
+            extracted_data = await asyncio.to_thread(gemini_service.analyze_medical_report, image_data)
             
             # 70% - Analysis Complete, Saving Data
             await self._update_progress(report_id, 70)
@@ -333,6 +401,7 @@ class ReportService:
             parameters = []
             param_records = []
             explanation_records = []
+            unexplained = []
             
             for param in extracted_data.get("parameters", []):
                 try:
@@ -373,6 +442,31 @@ class ReportService:
                         "next_steps": ["Consult your doctor."],
                         "generated_at": datetime.utcnow().isoformat(),
                     })
+                else:
+                    unexplained.append(param_record)
+
+            # Parameters the extraction left unexplained are explained in one batch call
+            if unexplained:
+                generated = await self.explanation_service.generate_report_explanations(
+                    [
+                        {k: p[k] for k in ("name", "value", "unit", "normal_range", "flag")}
+                        for p in unexplained
+                    ]
+                )
+                by_name = {str(e.get("name", "")).strip().lower(): e for e in generated}
+                for p in unexplained:
+                    exp = by_name.get(p["name"].strip().lower())
+                    if exp is None:
+                        continue
+                    explanation_records.append({
+                        "id": str(uuid.uuid4()),
+                        "parameter_id": p["id"],
+                        "what": exp["what"],
+                        "meaning": exp["meaning"],
+                        "causes": exp["causes"],
+                        "next_steps": exp["next_steps"],
+                        "generated_at": datetime.utcnow().isoformat(),
+                    })
 
             # Batch Insert
             if param_records:
@@ -413,12 +507,25 @@ class ReportService:
                 print(f"[ERROR] Failed to update error status: {db_e}")
             raise
 
+    async def _mark_interrupted(self, report_id: str, user_id: str, image_data: bytes):
+        """Fail a report whose processing was cut off by shutdown, so it does not stay 'processing'"""
+        logger.warning("Processing of report %s interrupted by shutdown", report_id)
+        await asyncio.to_thread(
+            self.db.table("reports").update(
+                {
+                    "status": "failed",
+                    "error_message": "Processing was interrupted by a server restart. Please upload the report again.",
+                    "updated_at": datetime.utcnow().isoformat(),
+                }
+            ).eq("id", report_id).execute
+        )
+
     async def get_report(self, report_id: str, user_id: str) -> Optional[Dict]:
         """Get report details. Checks for ownership OR family connection."""
         
         # 1. Try standard access (Own report)
-        response = (
-            self.db.table("reports")
+        response = await (
+            self.async_db.table("reports")
             .select("*")
             .eq("id", report_id)
             .eq("user_id", user_id)
@@ -429,7 +536,7 @@ class ReportService:
             
         # 2. Try Shared Access (Family report)
         # Fetch report metadata using Service Role to check owner
-        admin_res = self.storage_client.table("reports").select("*").eq("id", report_id).execute()
+        admin_res = await self.async_storage.table("reports").select("*").eq("id", report_id).execute()
         if not admin_res.data:
             return None # Report doesnt exist at all
             
@@ -451,10 +558,26 @@ class ReportService:
         time_range: str = "all",
         page: int = 1,
         limit: int = 20,
+        cursor: Optional[str] = None,
     ) -> Dict[str, Any]:
+        """
+        Newest-first report list with all filters applied in the query.
+        With a cursor, pages by (created_at, id) keyset; page/offset is kept for older clients.
+        """
+        after = decode_report_cursor(cursor) if cursor else None
+
+        # Keyset pages only need the planner estimate. Otherwise PostgREST's "estimated" count
+        # is exact for small result sets and switches to the planner estimate above the
+        # server's max-rows; narrow searches keep the exact count
+        if after:
+            count_mode = "planned"
+        elif search:
+            count_mode = "exact"
+        else:
+            count_mode = "estimated"
         query = (
-            self.storage_client.table("reports")
-            .select("*", count="exact")
+            self.async_storage.table("reports")
+            .select("*", count=count_mode)
             .eq("user_id", user_id)
         )
 
@@ -467,26 +590,64 @@ class ReportService:
         if flag_level:
             query = query.eq("flag_level", flag_level.lower())
 
-        offset = (page - 1) * limit
-        query = query.order("created_at", desc=True).range(offset, offset + limit - 1)
+        days = TIME_RANGE_DAYS.get(time_range)
+        if days:
+            query = query.gte("created_at", (datetime.utcnow() - timedelta(days=days)).isoformat())
 
-        response = query.execute()
+        query = query.order("created_at", desc=True).order("id", desc=True)
+        if after:
+            query = after_report_cursor(query, after)
+            offset = 0
+        else:
+            offset = (page - 1) * limit
+        # One extra row tells whether another page exists
+        response = await query.range(offset, offset + limit).execute()
 
+        rows = response.data or []
+        has_next = len(rows) > limit
+        items = rows[:limit]
+
+        total = response.count or 0
         return {
-            "items": response.data or [],
-            "total": response.count or 0,
+            "items": items,
+            "total": total,
+            "total_is_estimate": count_mode == "planned" or (
+                count_mode == "estimated" and total > EXACT_COUNT_MAX_ROWS
+            ),
             "page": page,
             "limit": limit,
-            "has_next": (response.count or 0) > offset + limit,
-            "has_prev": page > 1,
+            "has_next": has_next,
+            "has_prev": bool(after) or page > 1,
+            "next_cursor": encode_report_cursor(items[-1]) if has_next else None,
         }
 
-    async def delete_report(self, report_id: str, user_id: str) -> bool:
+    async def delete_report(
+        self,
+        report_id: str,
+        user_id: str,
+        background_tasks: Optional[BackgroundTasks] = None,
+    ) -> bool:
         # Direct delete. RLS policy ("Users can delete their own reports") ensures security.
-        self.db.table("reports").delete().eq("id", report_id).execute()
+        # Parameters, explanations and summaries go with it via ON DELETE CASCADE.
+        response = await self.async_db.table("reports").delete().eq("id", report_id).execute()
+        deleted = response.data or []
+        if deleted:
+            premium_status_cache.pop(user_id)
+            image_path = deleted[0].get("image_url")
+            # Nothing references the image once the row is gone, so removing it can wait
+            if image_path and background_tasks is not None:
+                background_tasks.add_task(self._purge_report_image, image_path)
         # Always return True (idempotent: if it's gone, mission accomplished)
         return True
 
+    async def _purge_report_image(self, image_path: str):
+        """Remove a deleted report's image from storage"""
+        try:
+            bucket = self.storage_client.storage.from_(settings.STORAGE_BUCKET)
+            await asyncio.to_thread(bucket.remove, [image_path])
+        except Exception as e:
+            logger.warning("Failed to remove report image %s: %s", image_path, e, exc_info=True)
+
     async def get_report_parameters(self, report_id: str, user_id: str) -> List[Dict]:
         """Get parameters for a report"""
         # Verify report ownership first
@@ -494,33 +655,84 @@ class ReportService:
         if not report:
             return []
             
-        response = (
-            self.storage_client.table("report_parameters")
+        response = await (
+            self.async_storage.table("report_parameters")
             .select("*")
             .eq("report_id", report_id)
             .execute()
         )
         params = response.data or []
-        
-        # Enrich with explanations
-        if params:
-            param_ids = [p["id"] for p in params]
-            explanations_response = (
-                self.storage_client.table("report_explanations")
-                .select("*")
-                .in_("parameter_id", param_ids)
-                .execute()
-            )
-            explanations = explanations_response.data or []
-            explanation_map = {e["parameter_id"]: e for e in explanations}
-            
-            for p in params:
-                p["explanation"] = explanation_map.get(p["id"])
-                # Frontend might expect 'range' instead of 'normal_range'
-                p["range"] = p.get("normal_range")
-
+        await self._attach_explanations(params)
         return params
 
+    async def _attach_explanations(self, params: List[Dict]):
+        """Add each parameter's newest explanation (and its 'range' alias), in one query"""
+        if not params:
+            return
+        explanations_response = await (
+            self.async_storage.table("report_explanations")
+            .select("*")
+            .in_("parameter_id", [p["id"] for p in params])
+            .execute()
+        )
+        explanation_map = latest_explanations(explanations_response.data or [])
+
+        for p in params:
+            p["explanation"] = explanation_map.get(p["id"])
+            # Frontend might expect 'range' instead of 'normal_range'
+            p["range"] = p.get("normal_range")
+
+    async def get_report_with_context(
+        self, report_id: str, user_id: str
+    ) -> Optional[Tuple[Dict, List[Dict], List[Dict]]]:
+        """
+        Report, parameters and explanations in one embedded query.
+        Same access rules as get_report (ownership or family connection).
+        """
+        response = await (
+            self.async_storage.table("reports")
+            .select("*, report_parameters(*, report_explanations(*))")
+            .eq("id", report_id)
+            .execute()
+        )
+        if not response.data:
+            return None
+
+        report = response.data[0]
+        if report["user_id"] != user_id and not await self.verify_family_access(user_id, report["user_id"]):
+            return None
+
+        parameters = report.pop("report_parameters", None) or []
+        explanations = []
+        for p in parameters:
+            explanations.extend(p.pop("report_explanations", None) or [])
+        explanation_map = latest_explanations(explanations)
+        for p in parameters:
+            p["explanation"] = explanation_map.get(p["id"])
+            p["range"] = p.get("normal_range")
+
+        return report, parameters, explanations
+
+    async def get_report_full(self, report_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Everything the report detail screen needs, with the two queries run concurrently.
+        The synthesis row is only returned once the report's access check has passed.
+        """
+        context, cached = await asyncio.gather(
+            self.get_report_with_context(report_id, user_id),
+            self._fetch_cached_synthesis(report_id),
+        )
+        if not context:
+            return None
+
+        report, parameters, explanations = context
+        return {
+            "report": report,
+            "parameters": parameters,
+            "explanations": explanations,
+            "synthesis": self._present_synthesis(cached),
+        }
+
     async def get_report_explanations(self, report_id: str, user_id: str) -> List[Dict]:
         """Get AI explanations for a report"""
         # Verify ownership
@@ -529,22 +741,24 @@ class ReportService:
             return []
             
         # Get parameter IDs for this report
-        params = await self.get_report_parameters(report_id, user_id)
-        if not params:
-            return []
-            
-        param_ids = [p["id"] for p in params]
+        params_response = await (
+            self.async_storage.table("report_parameters")
+            .select("id")
+            .eq("report_id", report_id)
+            .execute()
+        )
+        param_ids = [p["id"] for p in params_response.data or []]
         
         if not param_ids:
             return []
             
-        response = (
-            self.storage_client.table("report_explanations")
+        response = await (
+            self.async_storage.table("report_explanations")
             .select("*")
             .in_("parameter_id", param_ids)
             .execute()
         )
-        return response.data or []
+        return list(latest_explanations(response.data or []).values())
 
     async def find_related_reports(self, report: Dict, user_id: str) -> List[Dict]:
         """Find reports related to the given report (by Type)"""
@@ -552,8 +766,8 @@ class ReportService:
             return []
             
         # Find past reports of same type
-        response = (
-            self.db.table("reports")
+        response = await (
+            self.async_db.table("reports")
             .select("*")
             .eq("user_id", user_id)
             .eq("type", report["type"])
@@ -564,10 +778,25 @@ class ReportService:
         )
         
         related_reports = response.data or []
+        if not related_reports:
+            return []
         
-        # Enrich with parameters (Synthesis needs data)
+        # Enrich with parameters (Synthesis needs data): one query for all of them, with no
+        # per-report access check since the reports came through the caller's RLS-scoped client
+        params_response = await (
+            self.async_storage.table("report_parameters")
+            .select("*")
+            .in_("report_id", [r["id"] for r in related_reports])
+            .execute()
+        )
+        params = params_response.data or []
+        await self._attach_explanations(params)
+
+        params_by_report = {}
+        for p in params:
+            params_by_report.setdefault(p["report_id"], []).append(p)
         for r in related_reports:
-             r["parameters"] = await self.get_report_parameters(r["id"], user_id)
+            r["parameters"] = params_by_report.get(r["id"], [])
              
         return related_reports
 
@@ -579,8 +808,12 @@ class ReportService:
             raise ValueError("Report not found")
 
         # 2. Get from DB
-        response = (
-            self.storage_client.table("report_summaries")
+        return await self._fetch_cached_synthesis(report_id)
+
+    async def _fetch_cached_synthesis(self, report_id: str) -> Optional[Dict[str, Any]]:
+        """Stored synthesis row for a report, without an access check"""
+        response = await (
+            self.async_storage.table("report_summaries")
             .select("summary_text, status, error_message")
             .eq("report_id", report_id)
             .execute()
@@ -673,6 +906,51 @@ class ReportService:
             print(f"[CRITICAL] Outer synthesis error: {e}")
             return False
 
+    async def stream_synthesis(self, report: Dict[str, Any], user_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream synthesis fields as they are generated, for a report the caller
+        already fetched (and access-checked) with get_report.
+        A complete result is persisted to report_summaries like the background job does,
+        unless that job already holds (pending) or finished (completed) the row.
+        """
+        report_id = report["id"]
+        report["parameters"] = await self.get_report_parameters(report_id, user_id)
+        related = await self.find_related_reports(report, report["user_id"])
+
+        synthesis = {}
+        complete = False
+        async for item in self.synthesis_service.generate_synthesis_stream(report, related):
+            if "complete" in item:
+                complete = item["complete"]
+                continue
+            synthesis[item["field"]] = item["value"]
+            yield item
+
+        if (
+            not complete
+            or any(field not in synthesis for field in SYNTHESIS_FIELDS)
+            or synthesis["doctor_precis"] == "AI Synthesis unavailable."
+        ):
+            return
+        try:
+            current_time = datetime.utcnow().isoformat()
+            row = {
+                "status": "completed",
+                "summary_text": synthesis,
+                "error_message": None,
+                "updated_at": current_time
+            }
+            summaries = self.async_storage.table("report_summaries")
+            try:
+                await summaries.insert({**row, "report_id": report_id, "created_at": current_time}).execute()
+            except APIError as e:
+                if e.code != "23505":
+                    raise
+                # Only a failed attempt is replaced; a pending row is the background job's lock
+                await summaries.update(row).eq("report_id", report_id).eq("status", "failed").execute()
+        except Exception as e:
+            logger.exception("Failed to persist streamed synthesis for %s: %s", report_id, e)
+
     def _mark_synthesis_failed(self, report_id: str, error_message: str):
         """Helper to mark synthesis as failed"""
         try:
@@ -698,7 +976,11 @@ class ReportService:
         Maintains backward compatibility by returning structured response
         """
         cached = await self.get_cached_synthesis(report_id, user_id)
-        
+        return self._present_synthesis(cached)
+
+    @staticmethod
+    def _present_synthesis(cached: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Client-facing synthesis payload for a stored row (or its absence)"""
         if cached:
             if cached["status"] == "completed" and cached["data"]:
                 return {**cached["data"], "status": "completed"}
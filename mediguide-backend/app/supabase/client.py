@@ -1,17 +1,15 @@
 """
 Supabase client initialization
 """
-from supabase import create_client, Client
+from supabase import Client
 from app.core.config import settings
+from app.core.security import get_supabase_client
 
 
 def get_supabase() -> Client:
-    """Get Supabase client instance (anon key, respects RLS)"""
-    supabase_url = settings.SUPABASE_URL.rstrip('/') + '/'
-    return create_client(
-        supabase_url,
-        settings.SUPABASE_ANON_KEY
-    )
+    """Get Supabase client instance (anon key, respects RLS). Shared across requests."""
+    # Same pooled instance as app.core.security hands out
+    return get_supabase_client()
 
 
 def get_supabase_admin() -> Client:
@@ -19,8 +17,4 @@ def get_supabase_admin() -> Client:
     if not settings.SUPABASE_SERVICE_ROLE_KEY:
         raise ValueError("SUPABASE_SERVICE_ROLE_KEY not configured")
     
-    supabase_url = settings.SUPABASE_URL.rstrip('/') + '/'
-    return create_client(
-        supabase_url,
-        settings.SUPABASE_SERVICE_ROLE_KEY
-    )
+    return get_supabase_client(use_service_role=True)
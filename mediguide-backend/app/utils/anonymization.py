@@ -1,4 +1,14 @@
 import re
+from typing import Any
+
+# Redact common Name pattern: First Last (e.g., John Doe)
+# This is a basic pattern as requested by the user.
+_NAME_RE = re.compile(r'\b[A-Z][a-z]+ [A-Z][a-z]+\b')
+
+# Redact potential IDs (e.g., MRN-12345 or patient ID: 123)
+_ID_RE = re.compile(r'(?i)ID:?\s*\d+')
+_MRN_RE = re.compile(r'(?i)MRN:?\s*\d+')
+
 
 def anonymize_medical_data(text: str) -> str:
     """
@@ -8,12 +18,22 @@ def anonymize_medical_data(text: str) -> str:
     if not text:
         return ""
         
-    # Redact common Name pattern: First Last (e.g., John Doe)
-    # This is a basic pattern as requested by the user.
-    anonymized = re.sub(r'\b[A-Z][a-z]+ [A-Z][a-z]+\b', '[Patient]', text)
-    
-    # Redact potential IDs (e.g., MRN-12345 or patient ID: 123)
-    anonymized = re.sub(r'(?i)ID:?\s*\d+', 'ID: [Redacted]', anonymized)
-    anonymized = re.sub(r'(?i)MRN:?\s*\d+', 'MRN: [Redacted]', anonymized)
+    anonymized = _NAME_RE.sub('[Patient]', text)
+    anonymized = _ID_RE.sub('ID: [Redacted]', anonymized)
+    anonymized = _MRN_RE.sub('MRN: [Redacted]', anonymized)
     
     return anonymized
+
+
+def anonymize_values(data: Any) -> Any:
+    """
+    Apply anonymize_medical_data to every string value in a dict/list structure.
+    Keys and non-string values are left alone, so only real field content is scanned.
+    """
+    if isinstance(data, str):
+        return anonymize_medical_data(data)
+    if isinstance(data, dict):
+        return {k: anonymize_values(v) for k, v in data.items()}
+    if isinstance(data, list):
+        return [anonymize_values(v) for v in data]
+    return data
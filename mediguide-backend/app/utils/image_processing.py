@@ -78,3 +78,15 @@ def enhance_image(image_bytes: bytes) -> bytes:
     except Exception as e:
         print(f"[WARNING] Image enhancement failed: {e}")
         return image_bytes
+
+def binarize_for_ocr(image: Image.Image) -> Image.Image:
+    """
+    Grayscale + Otsu threshold, giving Tesseract a clean 1-channel black/white page.
+    Args:
+        image: Decoded PIL image
+    Returns:
+        8-bit single-channel PIL image
+    """
+    gray = cv2.cvtColor(np.asarray(image.convert("RGB")), cv2.COLOR_RGB2GRAY)
+    _, thresholded = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    return Image.fromarray(thresholded)
@@ -0,0 +1,65 @@
+"""
+Incremental parsing of a streamed JSON object
+"""
+import json
+from typing import Any, List, Tuple
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+
+
+class JsonObjectFieldStream:
+    """
+    Emits the top-level fields of a JSON object as soon as each value is complete.
+
+    Feed raw text chunks (markdown code fences around the object are tolerated);
+    every call returns the (key, value) pairs that finished in that chunk.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = None  # Index just after the opening brace / last parsed field
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Append a chunk and return newly completed fields"""
+        self._buffer += chunk
+        fields = []
+        if self.done:
+            return fields
+        if self._pos is None:
+            start = self._buffer.find("{")
+            if start < 0:
+                return fields
+            self._pos = start + 1
+
+        while True:
+            pos = self._skip(self._pos, ",")
+            if pos >= len(self._buffer):
+                return fields
+            if self._buffer[pos] == "}":
+                self.done = True
+                return fields
+            try:
+                key, pos = _decoder.raw_decode(self._buffer, pos)
+                pos = self._skip(pos, "")
+                if pos >= len(self._buffer):
+                    return fields
+                if self._buffer[pos] != ":":
+                    raise ValueError(f"Expected ':' at {pos}")
+                pos = self._skip(pos + 1, "")
+                value, end = _decoder.raw_decode(self._buffer, pos)
+            except json.JSONDecodeError:
+                # Value still incomplete; wait for more text
+                return fields
+            # A number may be cut mid-stream; only trust it once something follows
+            if end >= len(self._buffer) and not isinstance(value, (str, dict, list)):
+                return fields
+            fields.append((key, value))
+            self._pos = end
+
+    def _skip(self, pos: int, extra: str) -> int:
+        """Advance past whitespace (and the given separator characters)"""
+        while pos < len(self._buffer) and (self._buffer[pos] in _WHITESPACE or self._buffer[pos] in extra):
+            pos += 1
+        return pos
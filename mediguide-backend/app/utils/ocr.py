@@ -2,23 +2,126 @@
 OCR utilities for extracting text from medical report images
 Supports multiple OCR backends
 """
-from typing import Optional
+from typing import BinaryIO, Optional, Union
 import pytesseract
 from PIL import Image
 import io
 from app.core.config import settings
+from app.utils.cache import TTLCache
 
 
 import os
+import asyncio
+import hashlib
 import logging
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+
+try:
+    import tesserocr
+except ImportError:  # Optional; pytesseract runs the tesseract CLI instead
+    tesserocr = None
 
 logger = logging.getLogger(__name__)
 
+# Loaded Tesseract engines per worker thread and page segmentation mode (not thread-safe)
+_tess_apis = threading.local()
+
+# OCR gets its own threads so the per-thread engines above stay bounded by OCR_MAX_CONCURRENCY
+# (the default executor's threads are shared with every other to_thread call)
+_ocr_executor = ThreadPoolExecutor(max_workers=settings.OCR_MAX_CONCURRENCY, thread_name_prefix="ocr")
+
+# OCR is CPU-bound; cap how many run at once and optionally pace their starts
+_ocr_slots = asyncio.Semaphore(settings.OCR_MAX_CONCURRENCY)
+_next_ocr_start = 0.0
+
+# Extracted text keyed by (variant, content digest); hashing is far cheaper than OCR
+ocr_text_cache = TTLCache(maxsize=settings.OCR_CACHE_MAX_ENTRIES, ttl=settings.OCR_CACHE_TTL_SECONDS)
+
+
+def ocr_cache_key(variant: str, image_data: Union[bytes, BinaryIO]) -> tuple:
+    """Cache key for OCR output of these exact bytes (a seekable file is hashed in chunks)"""
+    if isinstance(image_data, bytes):
+        return variant, hashlib.blake2b(image_data, digest_size=16).digest()
+    image_data.seek(0)
+    digest = hashlib.file_digest(image_data, lambda: hashlib.blake2b(digest_size=16)).digest()
+    image_data.seek(0)
+    return variant, digest
+
+
+# Install locations tried when tesseract is not on PATH
+TESSERACT_COMMON_PATHS = (
+    "/usr/bin/tesseract",
+    "/usr/local/bin/tesseract",
+    "/nix/var/nix/profiles/default/bin/tesseract",
+    "/bin/tesseract",
+)
+
+# Resolved once at import; debug_ocr reports these instead of probing the filesystem per request
+TESSERACT_ON_PATH = shutil.which("tesseract")
+TESSERACT_LOCATIONS_CHECKED = {p: os.path.exists(p) for p in TESSERACT_COMMON_PATHS}
+
 # Explicitly set Tesseract path for Windows
 if os.name == 'nt':
     pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
-else:
+elif TESSERACT_ON_PATH:
     logger.info("OCR: Running on non-Windows OS (Linux presumed). Relying on system PATH for Tesseract.")
+else:
+    found = next((p for p, exists in TESSERACT_LOCATIONS_CHECKED.items() if exists), None)
+    if found:
+        pytesseract.pytesseract.tesseract_cmd = found
+        logger.info("OCR: tesseract not on PATH, using %s", found)
+
+
+@lru_cache(maxsize=1)
+def tesseract_version() -> str:
+    """Installed Tesseract version (spawns the CLI once per process)"""
+    try:
+        return str(pytesseract.get_tesseract_version())
+    except Exception as e:
+        return f"Error: {e}"
+
+
+def image_to_string(image: Image.Image, psm: int = 3) -> str:
+    """
+    English Tesseract text for a PIL image.
+    With tesserocr installed the engine and its language data stay loaded between calls;
+    otherwise each call spawns the tesseract CLI through pytesseract.
+    """
+    if tesserocr is None:
+        return pytesseract.image_to_string(image, lang='eng', config=f'--oem 3 --psm {psm}')
+
+    apis = getattr(_tess_apis, "by_psm", None)
+    if apis is None:
+        apis = _tess_apis.by_psm = {}
+    api = apis.get(psm)
+    if api is None:
+        api = apis[psm] = tesserocr.PyTessBaseAPI(lang='eng', psm=psm)
+    api.SetImage(image)
+    return api.GetUTF8Text()
+
+
+async def run_ocr(func, *args):
+    """Run a blocking OCR call on the OCR threads, within the process-wide concurrency and pacing limits"""
+    global _next_ocr_start
+    async with _ocr_slots:
+        interval = settings.OCR_MIN_INTERVAL_SECONDS
+        if interval > 0:
+            # Reserve the next start slot before sleeping so waiters queue up in order
+            now = time.monotonic()
+            start = max(now, _next_ocr_start)
+            _next_ocr_start = start + interval
+            if start > now:
+                await asyncio.sleep(start - now)
+        return await asyncio.get_running_loop().run_in_executor(_ocr_executor, partial(func, *args))
+
+
+def close_ocr_executor() -> None:
+    """Stop the OCR threads (application shutdown)"""
+    _ocr_executor.shutdown(wait=False, cancel_futures=True)
 
 
 class OCRService:
@@ -38,7 +141,12 @@ class OCRService:
             Extracted text string
         """
         if self.service == "tesseract":
-            return await self._tesseract_ocr(image_data)
+            key = ocr_cache_key("tesseract", image_data)
+            text = ocr_text_cache.get(key)
+            if text is None:
+                text = await self._tesseract_ocr(image_data)
+                ocr_text_cache.set(key, text)
+            return text
         elif self.service == "google_vision":
             return await self._google_vision_ocr(image_data)
         else:
@@ -46,9 +154,7 @@ class OCRService:
     
     async def _tesseract_ocr(self, image_data: bytes) -> str:
         """Extract text using Tesseract OCR (Non-blocking wrapper)"""
-        import asyncio
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, self._run_tesseract_sync, image_data)
+        return await run_ocr(self._run_tesseract_sync, image_data)
 
     def _run_tesseract_sync(self, image_data: bytes) -> str:
         """Synchronous Tesseract execution with image optimization"""
@@ -80,13 +186,11 @@ class OCRService:
         
         # Extract text with better configuration
         # Use PSM mode 6 (Assume a single uniform block of text)
-        custom_config = r'--oem 3 --psm 6'
-        text = pytesseract.image_to_string(image, lang='eng', config=custom_config)
+        text = image_to_string(image, psm=6)
         
         # If no text extracted, try with different PSM mode
         if not text.strip():
-            custom_config = r'--oem 3 --psm 11'  # Sparse text
-            text = pytesseract.image_to_string(image, lang='eng', config=custom_config)
+            text = image_to_string(image, psm=11)  # Sparse text
         
         if not text.strip():
             raise Exception("No text could be extracted from the image. Please ensure the image is clear and readable.")
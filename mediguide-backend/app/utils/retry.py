@@ -0,0 +1,42 @@
+"""
+Retry helpers for flaky network calls
+"""
+import asyncio
+import logging
+import random
+from typing import Any, Awaitable, Callable, Optional, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+async def retry_async(
+    func: Callable[..., Awaitable[Any]],
+    *args: Any,
+    attempts: int = 2,
+    attempt_timeout: Optional[float] = None,
+    base_delay: float = 0.5,
+    max_delay: float = 4.0,
+    retry_on: Tuple[Type[BaseException], ...] = (Exception,),
+    **kwargs: Any
+) -> Any:
+    """
+    Await func(*args, **kwargs), retrying with jittered exponential backoff.
+
+    Each attempt is capped at attempt_timeout seconds; a timeout counts as a
+    retryable failure. The last error is re-raised once attempts run out.
+
+    attempt_timeout only stops waiting: work running in a thread (asyncio.to_thread)
+    cannot be cancelled and keeps going, so each retry adds another in-flight call.
+    For blocking SDK calls, pass the SDK's own timeout instead and leave this unset.
+    """
+    retry_on = tuple(retry_on) + (asyncio.TimeoutError,)
+    for attempt in range(1, attempts + 1):
+        try:
+            return await asyncio.wait_for(func(*args, **kwargs), attempt_timeout)
+        except retry_on as e:
+            if attempt >= attempts:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+            logger.warning(
+                "Attempt %d/%d failed (%s); retrying in %.2fs", attempt, attempts, type(e).__name__, delay
+            )
+            await asyncio.sleep(delay)
@@ -0,0 +1,77 @@
+"""
+Upload Utilities
+Bounded reading of multipart uploads so oversized files are rejected without buffering them.
+"""
+from fastapi import HTTPException, Request, UploadFile, status
+from fastapi.responses import ORJSONResponse
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.config import settings
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File too large (max {max_bytes // (1024 * 1024)}MB)",
+    )
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Rejects multipart requests whose Content-Length exceeds the upload limit.
+    Runs before FastAPI parses the form, so the body is never read or spooled.
+    """
+
+    def __init__(self, app: ASGIApp, max_bytes: int = settings.MAX_UPLOAD_SIZE):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http":
+            headers = Headers(scope=scope)
+            content_length = headers.get("content-length", "")
+            if (
+                content_length.isdigit()
+                and int(content_length) > self.max_bytes + UPLOAD_CHUNK_SIZE
+                and headers.get("content-type", "").startswith("multipart/form-data")
+            ):
+                error = _too_large(self.max_bytes)
+                response = ORJSONResponse(
+                    status_code=error.status_code,
+                    content={"detail": error.detail},
+                    headers={"Connection": "close"},
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+async def read_upload_capped(request: Request, file: UploadFile, max_bytes: int = settings.MAX_UPLOAD_SIZE) -> bytes:
+    """
+    Read an uploaded file, failing as soon as it exceeds max_bytes.
+    The Content-Length header is checked first so obviously oversized requests
+    are rejected before any body is read.
+    """
+    content_length = request.headers.get("content-length")
+    # Content-Length covers the whole multipart body; allow a little for the part headers
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + UPLOAD_CHUNK_SIZE:
+        raise _too_large(max_bytes)
+
+    # Starlette has already spooled the part (to disk past 1MB) and knows its exact size,
+    # so a known size is validated without touching the data and read in a single copy
+    if file.size is not None:
+        if file.size > max_bytes:
+            raise _too_large(max_bytes)
+        return await file.read()
+
+    chunks = []
+    total = 0
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        total += len(chunk)
+        if total > max_bytes:
+            raise _too_large(max_bytes)
+        chunks.append(chunk)
+    return b"".join(chunks)
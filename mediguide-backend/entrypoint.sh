@@ -9,5 +9,11 @@ echo "==========================="
 # Use PORT from environment, default to 8080 if not set
 ACTUAL_PORT=${PORT:-8080}
 
-echo "Starting uvicorn on port: $ACTUAL_PORT"
-exec uvicorn app.main:app --host 0.0.0.0 --port $ACTUAL_PORT
+# Worker processes (uvicorn also honours WEB_CONCURRENCY); each has its own caches and report queue
+WORKERS=${WEB_CONCURRENCY:-1}
+
+echo "Starting uvicorn on port: $ACTUAL_PORT with $WORKERS worker(s)"
+# uvloop/httptools ship with uvicorn[standard]; pin them so a missing extra fails loudly
+exec uvicorn app.main:app --host 0.0.0.0 --port $ACTUAL_PORT --log-level info \
+    --loop uvloop --http httptools \
+    --workers $WORKERS --timeout-keep-alive ${KEEP_ALIVE_SECONDS:-30}
@@ -0,0 +1,16 @@
+-- Synthesis Cache
+-- Content-addressed cache of AI synthesis results, keyed by a SHA-256 of the minified
+-- current report + history payload, so identical inputs never hit the LLM twice.
+-- Only the backend (service role) reads and writes this table.
+
+CREATE TABLE IF NOT EXISTS synthesis_cache (
+    key TEXT PRIMARY KEY,
+    result JSONB NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- RLS on with no policies: invisible to anon/authenticated clients
+ALTER TABLE synthesis_cache ENABLE ROW LEVEL SECURITY;
+
+-- For expiring old entries
+CREATE INDEX IF NOT EXISTS idx_synthesis_cache_created_at ON synthesis_cache(created_at);
@@ -0,0 +1,32 @@
+-- Synthesis Cache: semantic lookup
+-- Stores an embedding of each cached payload so near-duplicate requests (e.g. differing only
+-- by a timestamp or parameter order) can reuse a prior synthesis. Requires pgvector.
+
+CREATE EXTENSION IF NOT EXISTS vector;
+
+ALTER TABLE synthesis_cache
+ADD COLUMN IF NOT EXISTS embedding VECTOR(1536);
+
+CREATE INDEX IF NOT EXISTS idx_synthesis_cache_embedding
+    ON synthesis_cache USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
+
+-- Nearest cached synthesis above a similarity threshold
+create or replace function match_synthesis_cache(
+  query_embedding vector(1536),
+  min_similarity float,
+  min_created_at timestamptz
+)
+returns table (key text, result jsonb, similarity float)
+language sql stable
+set search_path = public
+as $$
+  select sc.key, sc.result, 1 - (sc.embedding <=> query_embedding) as similarity
+  from synthesis_cache sc
+  where sc.embedding is not null
+    and sc.created_at >= min_created_at
+    and 1 - (sc.embedding <=> query_embedding) >= min_similarity
+  order by sc.embedding <=> query_embedding
+  limit 1;
+$$;
+
+grant execute on function match_synthesis_cache(vector, float, timestamptz) to service_role;
@@ -0,0 +1,8 @@
+-- Admin Report List Indexes
+-- Keyset pagination for the admin report lists:
+-- WHERE (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC
+
+CREATE INDEX IF NOT EXISTS ix_reports_created_at_id_desc
+    ON reports(created_at DESC, id DESC);
+
+-- The per-user list uses reports_user_created_idx (migration 010)
@@ -0,0 +1,17 @@
+-- Report List Indexes
+-- Keyset pagination for GET /reports: WHERE user_id = ? AND (created_at, id) < (?, ?)
+-- ORDER BY created_at DESC, id DESC
+
+CREATE INDEX IF NOT EXISTS reports_user_created_idx
+    ON reports(user_id, created_at DESC, id DESC);
+
+-- Flag filters mostly ask for the rare abnormal reports; partial indexes keep them small
+CREATE INDEX IF NOT EXISTS reports_user_created_red_idx
+    ON reports(user_id, created_at DESC, id DESC) WHERE flag_level = 'red';
+CREATE INDEX IF NOT EXISTS reports_user_created_yellow_idx
+    ON reports(user_id, created_at DESC, id DESC) WHERE flag_level = 'yellow';
+
+-- Substring search (type/lab_name ILIKE '%term%')
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS reports_type_trgm_idx ON reports USING GIN (type gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS reports_lab_name_trgm_idx ON reports USING GIN (lab_name gin_trgm_ops);
@@ -0,0 +1,43 @@
+-- Family Connections Enriched View
+-- One row per connection with both sides' profile names already resolved, so
+-- GET /family/members is a single query instead of connections + profiles + a Python merge.
+-- Profile columns vary between environments, so names are read through to_jsonb():
+-- a missing column yields NULL instead of failing the view.
+
+CREATE OR REPLACE VIEW family_connections_enriched
+WITH (security_invoker = true) AS
+SELECT
+    fc.*,
+    sender.profile_name AS sender_profile_name,
+    sender.identifier AS sender_identifier,
+    receiver.profile_name AS receiver_profile_name,
+    receiver.identifier AS receiver_identifier
+FROM family_connections fc
+LEFT JOIN LATERAL (
+    SELECT
+        COALESCE(
+            NULLIF(j->>'full_name', ''),
+            NULLIF(j->>'profile_name', ''),
+            NULLIF(j->>'first_name', ''),
+            NULLIF(j->>'phone_number', ''),
+            'User'
+        ) AS profile_name,
+        COALESCE(NULLIF(j->>'phone_number', ''), NULLIF(j->>'email', '')) AS identifier
+    FROM (SELECT to_jsonb(p) AS j FROM profiles p WHERE p.id = fc.user_id) sp
+) sender ON TRUE
+LEFT JOIN LATERAL (
+    SELECT
+        COALESCE(
+            NULLIF(j->>'full_name', ''),
+            NULLIF(j->>'profile_name', ''),
+            NULLIF(j->>'first_name', ''),
+            NULLIF(j->>'phone_number', ''),
+            'User'
+        ) AS profile_name,
+        COALESCE(NULLIF(j->>'phone_number', ''), NULLIF(j->>'email', '')) AS identifier
+    FROM (SELECT to_jsonb(p) AS j FROM profiles p WHERE p.id = fc.connected_user_id) rp
+) receiver ON TRUE;
+
+-- Only the backend (service role) reads this view; it exposes other users' contact details
+REVOKE ALL ON family_connections_enriched FROM anon, authenticated;
+GRANT SELECT ON family_connections_enriched TO service_role;
@@ -0,0 +1,15 @@
+-- Family Connection Pair Key
+-- An invite A -> B and an invite B -> A are the same connection. Storing the pair in a
+-- canonical (lower id, higher id) order lets one unique index both answer the duplicate check
+-- with a single probe and reject a racing second invite at insert time.
+-- Creating the index fails if reversed duplicates already exist; remove those first.
+
+ALTER TABLE family_connections
+  ADD COLUMN IF NOT EXISTS pair_low UUID
+    GENERATED ALWAYS AS (LEAST(user_id, connected_user_id)) STORED,
+  ADD COLUMN IF NOT EXISTS pair_high UUID
+    GENERATED ALWAYS AS (GREATEST(user_id, connected_user_id)) STORED;
+
+CREATE UNIQUE INDEX IF NOT EXISTS family_connections_pair_key
+    ON family_connections(pair_low, pair_high)
+    WHERE connected_user_id IS NOT NULL;